@@ -1,46 +1,95 @@
-from pella_main import main as start_pella_bot
-import os, asyncio, traceback, uvicorn, re, httpx, urllib.parse, math, tempfile, subprocess
+import os, sys, asyncio, traceback, uvicorn, httpx, urllib.parse, math, tempfile, subprocess, time, importlib, hmac
 from datetime import datetime, timezone
 from contextlib import asynccontextmanager
 
-import imageio_ffmpeg
 from pyrogram import Client, filters, raw
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 from pyrogram.file_id import FileId
 from pyrogram.session import Session, Auth
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import StreamingResponse
+from pyrogram.errors import Unauthorized
+from fastapi import FastAPI, Request, HTTPException, Body
+from fastapi.responses import StreamingResponse, JSONResponse, Response, PlainTextResponse
+from fastapi.templating import Jinja2Templates
+from starlette.background import BackgroundTask
 
 from config import Config
 from database import db
-
-QUALITY_PATTERN = re.compile(r"(?<!\d)(2160|1440|1080|720|480|360|240)p(?!\d)", re.IGNORECASE)
-STRIP_TOKENS_PATTERN = re.compile(
-    r"\b(2160p|1440p|1080p|720p|480p|360p|240p|x264|x265|hevc|hdrip|webrip|web[- ]?dl|bluray|dvdrip|10bit|8bit|esubs|dual[- ]?audio|amzn|nf|hindi|english|tamil|telugu|malayalam)\b",
-    re.IGNORECASE,
-)
+from caption_parser import parse_media
+import screenshot_service
+from screenshot_service import MIN_SCREENSHOT_COUNT, SCREENSHOT_BATCH_LIMIT
+import media_probe
+from media_probe import parse_ffmpeg_info, quality_from_resolution, ffmpeg_binary
+from signed_links import sign_link, resolve_message_id, LINK_TTL
+from file_info import get_file_info
+import session_store
+import workers
+from tg_scheduler import scheduler_for, PRIORITY_USER, PRIORITY_CHANNEL, PRIORITY_BACKGROUND
+import metrics
+from metrics import span, trace
 
 SCREENSHOT_COUNT = 7
-MIN_SCREENSHOT_COUNT = 6
 SCREENSHOT_WORKERS = 2
 DOWNLOAD_RETRIES = 3
+SHORTENER_INLINE_TIMEOUT = float(os.environ.get("SHORTENER_INLINE_TIMEOUT", 3))
+SHORTENER_TIMEOUT = 15
+# A memoised short link points at a signed long URL, so it must be dropped well before that token
+# expires; with LINK_TTL=0 this only bounds the short_links collection
+SHORT_LINK_MEMO_TTL = int(os.environ.get("SHORT_LINK_MEMO_TTL", 30 * 86400))
+SHORT_LINK_MEMO_SECONDS = min(SHORT_LINK_MEMO_TTL, LINK_TTL // 2) if LINK_TTL else SHORT_LINK_MEMO_TTL
 
 
 @asynccontextmanager
-async def lifespan(app: FastAPI):
-    await db.connect()
+async def startup_phase(name: str):
+    started = time.perf_counter()
     try:
-        await bot.start()
-        Config.BOT_USERNAME = (await bot.get_me()).username
-        multi_clients[0] = bot
-        work_loads[0] = 0
-        await initialize_clients()
-        await bot.get_chat(Config.STORAGE_CHANNEL)
-        asyncio.create_task(start_pella_bot())
-        print("✅ Bot is Live and Ready!")
-    except Exception as e:
-        print(f"Startup Error: {e}")
+        yield
+    finally:
+        print(f"[startup] {name}: {time.perf_counter() - started:.2f}s")
+
+
+async def start_pella_bot():
+    # Imported here: pella_main connects pymongo at import time and exits if its env is missing
+    try:
+        async with startup_phase("pella import"):
+            pella_main = await asyncio.to_thread(importlib.import_module, "pella_main")
+    except (Exception, SystemExit) as e:
+        print(f"Pella bot disabled: {e}")
+        return
+    await pella_main.main()
+
+
+async def start_services():
+    """Runs after the HTTP server is up; /dl serves with whichever clients are ready."""
+    async with startup_phase("total"):
+        try:
+            async with startup_phase("main bot"):
+                if workers.WORKER_INDEX != 0:
+                    bot.no_updates = True  # only worker 0 handles commands and channel posts
+                await session_store.start_with_session(bot, session_name(0), Config.BOT_TOKEN)
+                Config.BOT_USERNAME = (await bot.get_me()).username
+                multi_clients[0] = bot
+                set_load(0, 0)
+            if workers.PELLA_IN_PROCESS:
+                background_tasks.append(asyncio.create_task(start_pella_bot()))
+            async with startup_phase("extra clients + storage channel"):
+                await asyncio.gather(initialize_clients(), bot.get_chat(Config.STORAGE_CHANNEL))
+            print("✅ Bot is Live and Ready!")
+        except Exception as e:
+            print(f"Startup Error: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    async with startup_phase("database"):
+        await db.connect()
+    background_tasks.append(asyncio.create_task(start_services()))
     yield
+    for task in background_tasks:
+        task.cancel()
+    if shortener_client is not None:
+        await shortener_client.aclose()
+    if handoff_client is not None:
+        await handoff_client.aclose()
     if bot.is_initialized:
         await bot.stop()
 
@@ -50,7 +99,9 @@ bot = Client("SimpleStreamBot", api_id=Config.API_ID, api_hash=Config.API_HASH,
 multi_clients = {}
 work_loads = {}
 class_cache = {}
-screenshot_locks = {}
+background_tasks = []
+templates = Jinja2Templates(directory="templates")
+FILE_INFO_MAX_AGE = 300
 screenshot_semaphore = asyncio.Semaphore(SCREENSHOT_WORKERS)
 
 
@@ -58,10 +109,25 @@ def log_event(message: str):
     print(f"[bot] {message}")
 
 
+async def send_reply(m: Message, *args, **kwargs):
+    return await scheduler_for(m._client).call(m.reply_text, *args, chat=m.chat.id, priority=PRIORITY_USER, **kwargs)
+
+
+def session_name(client_id) -> str:
+    # every worker has its own connection to the main bot
+    return f"client_{client_id}" if workers.WORKER_INDEX == 0 else f"client_{client_id}_w{workers.WORKER_INDEX}"
+
+
+def set_load(client_id, value):
+    work_loads[client_id] = value
+    workers.report_load(client_id, value)
+
+
 async def start_client(client_id, bot_token):
     try:
-        client = await Client(name=str(client_id), api_id=Config.API_ID, api_hash=Config.API_HASH, bot_token=bot_token, no_updates=True, in_memory=True).start()
-        work_loads[client_id] = 0
+        client = Client(name=str(client_id), api_id=Config.API_ID, api_hash=Config.API_HASH, bot_token=bot_token, no_updates=True, in_memory=True)
+        await session_store.start_with_session(client, session_name(client_id), bot_token)
+        set_load(client_id, 0)
         multi_clients[client_id] = client
     except Exception:
         traceback.print_exc()
@@ -69,65 +135,104 @@ async def start_client(client_id, bot_token):
 
 async def initialize_clients():
     tokens = {c + 1: t for c, (_, t) in enumerate(filter(lambda n: n[0].startswith("MULTI_TOKEN"), sorted(os.environ.items())))}
-    for i, token in tokens.items():
-        await start_client(i, token)
+    await asyncio.gather(*(start_client(i, token) for i, token in tokens.items() if workers.owns_client(i)))
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures; lets one trial call through after `cooldown` seconds."""
+
+    def __init__(self, threshold: int = 3, cooldown: float = 60):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow(self) -> bool:
+        if self.failures < self.threshold:
+            return True
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return False
+        # half-open: this caller is the trial; everyone else waits another cooldown unless it succeeds
+        self.opened_at = time.monotonic()
+        return True
+
+    def record(self, ok: bool):
+        if ok:
+            self.failures = 0
+            return
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+shortener_breaker = CircuitBreaker()
+shortener_client = None
 
 
-async def get_shortlink(url):
+def get_shortener_client() -> httpx.AsyncClient:
+    global shortener_client
+    if shortener_client is None or shortener_client.is_closed:
+        shortener_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(SHORTENER_TIMEOUT, connect=5),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+    return shortener_client
+
+
+async def request_shortlink(api_url: str, api_key: str, url: str, storage_id=None):
+    try:
+        request_url = f"{api_url}?api={api_key}&url={urllib.parse.quote(url)}"
+        res = await get_shortener_client().get(request_url)
+        data = res.json()
+        short_url = data.get("shortenedUrl") or data.get("shortlink") or data.get("url")
+    except Exception:
+        short_url = None
+    shortener_breaker.record(bool(short_url))
+    if short_url and storage_id is not None:
+        await db.save_short_link(storage_id, api_url, short_url, SHORT_LINK_MEMO_SECONDS)
+    return short_url
+
+
+async def get_shortlink(url, storage_id=None, on_late=None):
+    """
+    Circuit-broken shortening, memoised per storage message and shortener (the long URL carries
+    a fresh signed token every time, so it cannot be the key). Waits at most SHORTENER_INLINE_TIMEOUT for the shortener;
+    if it is slower, the long URL is returned and `on_late(short_url)` runs once it arrives.
+    """
     shortener = await db.get_shortener()
     if not shortener:
         return url
     api_url = shortener['api_url'].strip().replace('[', '').replace(']', '')
     api_key = shortener['api_key'].strip().replace('[', '').replace(']', '')
-    try:
-        async with httpx.AsyncClient() as client:
-            request_url = f"{api_url}?api={api_key}&url={urllib.parse.quote(url)}"
-            res = await client.get(request_url, timeout=15)
-            data = res.json()
-            short_url = data.get("shortenedUrl") or data.get("shortlink") or data.get("url")
-            if short_url:
-                return short_url
-    except Exception:
-        pass
-    return url
-
-
-def extract_quality(text: str) -> int:
-    if not text:
-        return 0
-    found = QUALITY_PATTERN.findall(text)
-    if not found:
-        return 0
-    return max(int(x) for x in found)
+    memo = await db.get_short_link(storage_id, api_url) if storage_id is not None else None
+    if memo:
+        return memo
+    if not shortener_breaker.allow():
+        return url
 
+    task = asyncio.create_task(request_shortlink(api_url, api_key, url, storage_id))
+    done, _ = await asyncio.wait({task}, timeout=SHORTENER_INLINE_TIMEOUT)
+    if done:
+        return task.result() or url
 
-def extract_movie_key(file_name: str, caption: str = "") -> str:
-    source = (file_name or caption or "unknown_movie").lower().replace("_", " ").replace(".", " ")
-    source = STRIP_TOKENS_PATTERN.sub(" ", source)
-    source = re.sub(r"\b\d{3,4}p\b", " ", source)
-    source = re.sub(r"\s+", " ", source).strip()
-    return source[:120] or "unknown_movie"
+    if on_late:
+        async def deliver():
+            short_url = await task
+            if short_url:
+                try:
+                    await on_late(short_url)
+                except Exception:
+                    traceback.print_exc()
+        asyncio.create_task(deliver())
+    return url
 
 
-def infer_quality_from_media(media_obj) -> int:
+def infer_quality_from_media(media_obj, probe=None) -> int:
+    if probe and probe.get("quality"):
+        return probe["quality"]
     if not media_obj:
         return 0
-    h = getattr(media_obj, "height", 0) or 0
-    if h >= 2000:
-        return 2160
-    if h >= 1300:
-        return 1440
-    if h >= 900:
-        return 1080
-    if h >= 650:
-        return 720
-    if h >= 450:
-        return 480
-    if h >= 320:
-        return 360
-    if h > 0:
-        return 240
-    return 0
+    return quality_from_resolution(getattr(media_obj, "width", 0) or 0, getattr(media_obj, "height", 0) or 0)
 
 
 def should_refresh_screenshots(existing_doc, new_quality: int, new_size: int) -> bool:
@@ -147,24 +252,20 @@ def should_refresh_screenshots(existing_doc, new_quality: int, new_size: int) ->
 
 
 def get_video_duration_seconds(video_path: str) -> float:
-    ffmpeg_bin = imageio_ffmpeg.get_ffmpeg_exe()
+    ffmpeg_bin = ffmpeg_binary()
     result = subprocess.run(
         [ffmpeg_bin, "-i", video_path],
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
         text=True,
     )
-    output = result.stderr or ""
-    match = re.search(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)", output)
-    if not match:
-        return 0.0
-    h, m, sec = match.groups()
-    return int(h) * 3600 + int(m) * 60 + float(sec)
+    return parse_ffmpeg_info(result.stderr or "")["duration"]
 
 
-def capture_screenshots(video_path: str, output_dir: str, count: int = 7):
-    ffmpeg_bin = imageio_ffmpeg.get_ffmpeg_exe()
-    duration = get_video_duration_seconds(video_path)
+def capture_screenshots(video_path: str, output_dir: str, count: int = 7, duration: float = 0.0):
+    ffmpeg_bin = ffmpeg_binary()
+    if duration <= 0:
+        duration = get_video_duration_seconds(video_path)
     if duration <= 0:
         return []
 
@@ -197,24 +298,47 @@ def capture_screenshots(video_path: str, output_dir: str, count: int = 7):
 
 
 async def generate_and_store_screenshots(media: Message, storage_message_id: int):
+    with trace("stream_screenshots", storage_message_id):
+        await store_screenshots(media, storage_message_id)
+
+
+async def store_screenshots(media: Message, storage_message_id: int):
     media_obj = media.document or media.video or media.audio
     if not media_obj:
         log_event(f"screenshots skipped: no media object for message {storage_message_id}")
         return
 
     name_for_key = media_obj.file_name if getattr(media_obj, "file_name", None) else ""
-    cap_text = media.caption.html if media.caption else ""
-    movie_key = extract_movie_key(name_for_key, cap_text)
+    cap_text = str(media.caption or "")
+    parsed = parse_media(name_for_key, cap_text)
+    movie_key = parsed["movie_key"]
+    # Registered before the probe so a Pella post waiting on this title is released on every
+    # outcome, early skips included
+    inflight_event = screenshot_service.begin(movie_key)
+    try:
+        await capture_and_store_screenshots(media_obj, parsed, storage_message_id)
+    finally:
+        screenshot_service.finish(movie_key, inflight_event)
 
-    text_quality = max(extract_quality(name_for_key), extract_quality(cap_text))
-    media_quality = infer_quality_from_media(media_obj)
-    quality = max(text_quality, media_quality)
+
+async def capture_and_store_screenshots(media_obj, parsed: dict, storage_message_id: int):
+    movie_key = parsed["movie_key"]
+    text_quality = parsed["resolution"]
+    try:
+        with span("probe"):
+            probe = await media_probe.probe_message(storage_message_id, getattr(media_obj, "file_unique_id", ""))
+    except Exception as probe_error:
+        log_event(f"probe failed for message {storage_message_id}: {probe_error}")
+        probe = None
+    media_quality = infer_quality_from_media(media_obj, probe)
+    # Container metadata beats whatever the uploader typed into the name
+    quality = media_quality if probe and media_quality else max(text_quality, media_quality)
     if quality <= 0:
         log_event(f"screenshots skipped: quality not found for message {storage_message_id}")
         return
 
     source_file_size = int(getattr(media_obj, "file_size", 0) or 0)
-    lock = screenshot_locks.setdefault(movie_key, asyncio.Lock())
+    lock = screenshot_service.get_lock(movie_key)
 
     async with screenshot_semaphore:
         async with lock:
@@ -236,7 +360,8 @@ async def generate_and_store_screenshots(media: Message, storage_message_id: int
                     downloaded = False
                     for attempt in range(1, DOWNLOAD_RETRIES + 1):
                         try:
-                            await bot.download_media(storage_msg, file_name=source_file)
+                            with span("screenshot_download"):
+                                await bot.download_media(storage_msg, file_name=source_file)
                             downloaded = True
                             break
                         except Exception as download_error:
@@ -247,21 +372,29 @@ async def generate_and_store_screenshots(media: Message, storage_message_id: int
                         log_event(f"screenshots failed: could not download source for '{movie_key}'")
                         return
 
-                    paths = await asyncio.to_thread(capture_screenshots, source_file, tmpdir, SCREENSHOT_COUNT)
+                    duration = (probe or {}).get("duration", 0.0)
+                    with span("capture_screenshots"):
+                        paths = await asyncio.to_thread(capture_screenshots, source_file, tmpdir, SCREENSHOT_COUNT, duration)
                     if len(paths) < MIN_SCREENSHOT_COUNT:
                         log_event(f"screenshots skipped: only {len(paths)} captured for '{movie_key}'")
                         return
 
                     screenshot_links = []
                     for i, p in enumerate(paths, start=1):
-                        sent_img = await bot.send_document(
-                            chat_id=Config.STORAGE_CHANNEL,
-                            document=p,
-                            file_name=f"{movie_key.replace(' ', '_')}_{quality}p_{i}.jpg",
-                            caption=f"Screenshot {i} | {movie_key} | {quality}p",
-                        )
+                        with span("screenshot_upload"):
+                            sent_img = await scheduler_for(bot).call(
+                                bot.send_document,
+                                chat=Config.STORAGE_CHANNEL,
+                                priority=PRIORITY_BACKGROUND,
+                                chat_id=Config.STORAGE_CHANNEL,
+                                document=p,
+                                file_name=f"{movie_key.replace(' ', '_')}_{quality}p_{i}.jpg",
+                                caption=f"Screenshot {i} | {movie_key} | {quality}p",
+                            )
                         img_name = f"{movie_key.replace(' ', '_')}_{quality}p_{i}.jpg"
-                        screenshot_links.append(f"{Config.BASE_URL}/dl/{sent_img.id}/{img_name}")
+                        # stored in movie_screenshots and copied into the Pella catalog, so never expiring
+                        token = sign_link(sent_img.id, img_name, int(getattr(sent_img.document, "file_size", 0) or 0), "image/jpeg", ttl=0)
+                        screenshot_links.append(f"{Config.BASE_URL}/dl/{token}/{img_name}")
 
                 payload = {
                     "movie_key": movie_key,
@@ -271,7 +404,9 @@ async def generate_and_store_screenshots(media: Message, storage_message_id: int
                     "screenshot_links": screenshot_links,
                     "updatedAt": datetime.now(timezone.utc).isoformat(),
                 }
-                await db.upsert_movie_screenshots(movie_key, payload)
+                with span("mongo_write"):
+                    await db.upsert_movie_screenshots(movie_key, payload)
+                screenshot_service.forget(movie_key)
                 log_event(f"screenshots saved: {len(screenshot_links)} for '{movie_key}' ({quality}p)")
             except Exception:
                 log_event(f"screenshots error for '{movie_key}'")
@@ -280,12 +415,12 @@ async def generate_and_store_screenshots(media: Message, storage_message_id: int
 
 @bot.on_message(filters.command("start") & filters.private)
 async def start_cmd(client, m):
-    await m.reply_text("👋 Hello! Send me a file to get a direct download link.")
+    await send_reply(m, "👋 Hello! Send me a file to get a direct download link.")
 
 
 @bot.on_message(filters.command("help") & filters.private)
 async def help_cmd(client, m):
-    await m.reply_text("🚀 **Admin Commands:**\n\n🔹 `/add_channel [ID]`\n🔹 `/set_shortener [API_URL] [API_KEY]`\n🔹 `/del_shortener`")
+    await send_reply(m, "🚀 **Admin Commands:**\n\n🔹 `/add_channel [ID]`\n🔹 `/set_shortener [API_URL] [API_KEY]`\n🔹 `/del_shortener`\n🔹 `/backfill [CHANNEL_ID] [FIRST_MSG_ID] [LAST_MSG_ID]`\n🔹 `/backfill_stop [CHANNEL_ID]`")
 
 
 @bot.on_message(filters.command(["add_channel", "remove_channel"]) & filters.user(Config.OWNER_ID))
@@ -296,12 +431,12 @@ async def chan_manage(client, m):
         cid = int(m.command[1])
         if "add" in m.command[0]:
             await db.add_channel(cid)
-            await m.reply("✅ Channel Added!")
+            await send_reply(m, "✅ Channel Added!")
         else:
             await db.remove_channel(cid)
-            await m.reply("❌ Channel Removed!")
+            await send_reply(m, "❌ Channel Removed!")
     except Exception:
-        await m.reply("Invalid ID.")
+        await send_reply(m, "Invalid ID.")
 
 
 @bot.on_message(filters.command("set_shortener") & filters.user(Config.OWNER_ID))
@@ -309,25 +444,98 @@ async def set_short_cmd(client, m):
     if len(m.command) < 3:
         return
     await db.set_shortener(m.command[1], m.command[2])
-    await m.reply("✅ Shortener Updated!")
+    await send_reply(m, "✅ Shortener Updated!")
 
 
 @bot.on_message(filters.command("del_shortener") & filters.user(Config.OWNER_ID))
 async def del_short_cmd(client, m):
     await db.del_shortener()
-    await m.reply("❌ Shortener Deleted!")
+    await send_reply(m, "❌ Shortener Deleted!")
+
+
+async def load_backfill():
+    """backfill imports pella_main, which exits at import without its env; None then."""
+    try:
+        return await asyncio.to_thread(importlib.import_module, "backfill")
+    except (Exception, SystemExit) as e:
+        print(f"Backfill unavailable: {e}")
+        return None
+
+
+@bot.on_message(filters.command("backfill") & filters.user(Config.OWNER_ID))
+async def backfill_cmd(client, m):
+    backfill = await load_backfill()
+    if backfill is None:
+        await send_reply(m, "Pella disabled.")
+        return
+    if len(m.command) < 4:
+        await send_reply(m, "Usage: `/backfill [CHANNEL_ID] [FIRST_MSG_ID] [LAST_MSG_ID]`")
+        return
+    try:
+        chat_id, first_id, last_id = (int(x) for x in m.command[1:4])
+    except ValueError:
+        await send_reply(m, "Invalid arguments.")
+        return
+    if chat_id in backfill.running_jobs and not backfill.running_jobs[chat_id].done():
+        await send_reply(m, "⏳ Backfill already running for this channel.")
+        return
+
+    status = await send_reply(m, f"⏳ Backfill started for `{chat_id}` ({first_id} → {last_id})")
+
+    async def edit_status(text):
+        await scheduler_for(client).call(status.edit_text, text, chat=m.chat.id, priority=PRIORITY_BACKGROUND)
+
+    async def progress(done_id, posts):
+        try:
+            await edit_status(f"⏳ Backfill `{chat_id}`: up to message {done_id}, {posts} posts")
+        except Exception:
+            pass
+
+    async def job():
+        try:
+            posts = await backfill.run_backfill(list(multi_clients.values()), chat_id, first_id, last_id, progress)
+            await edit_status(f"✅ Backfill `{chat_id}` done: {posts} posts")
+        except asyncio.CancelledError:
+            await edit_status(f"⏸ Backfill `{chat_id}` paused, run /backfill again to resume")
+        except Exception as e:
+            await edit_status(f"❌ Backfill `{chat_id}` failed: {e}")
+
+    backfill.running_jobs[chat_id] = asyncio.create_task(job())
+
+
+@bot.on_message(filters.command("backfill_stop") & filters.user(Config.OWNER_ID))
+async def backfill_stop_cmd(client, m):
+    backfill = await load_backfill()
+    if backfill is None:
+        await send_reply(m, "Pella disabled.")
+        return
+    if len(m.command) < 2:
+        return
+    try:
+        task = backfill.running_jobs.get(int(m.command[1]))
+    except ValueError:
+        await send_reply(m, "Invalid ID.")
+        return
+    if task and not task.done():
+        task.cancel()
+        await send_reply(m, "⏸ Stopping backfill…")
+    else:
+        await send_reply(m, "No backfill running for this channel.")
 
 
 @bot.on_message(filters.command("status") & filters.user(Config.OWNER_ID))
 async def status_cmd(client, m):
     allowed = "configured" if Config.STORAGE_CHANNEL else "missing"
     shortener = await db.get_shortener()
-    await m.reply_text(
+    await send_reply(
+        m,
         "🧩 **Bot Status**\n"
         f"- Storage channel: {allowed} (`{Config.STORAGE_CHANNEL}`)\n"
         f"- Base URL: `{Config.BASE_URL or 'missing'}`\n"
         f"- Shortener: `{'enabled' if shortener else 'disabled'}`\n"
-        f"- Screenshot workers: `{SCREENSHOT_WORKERS}`"
+        f"- Screenshot workers: `{SCREENSHOT_WORKERS}`\n"
+        f"- Stream load: `{workers.load_summary()}`\n"
+        "- Slowest stages:\n" + ("\n".join(f"  `{line}`" for line in metrics.summary()) or "  none yet")
     )
 
 
@@ -339,26 +547,50 @@ class ByteStreamer:
     async def get_location(f: FileId):
         return raw.types.InputDocumentFileLocation(id=f.media_id, access_hash=f.access_hash, file_reference=f.file_reference, thumb_size=f.thumbnail_size)
 
+    async def media_session(self, i: int, dc_id: int, fresh: bool = False) -> Session:
+        """Media session for a DC; reuses a persisted auth key (already authorised) when there is one."""
+        c = self.client
+        if not fresh and dc_id in c.media_sessions:
+            return c.media_sessions[dc_id]
+        if dc_id == await c.storage.dc_id():
+            c.media_sessions[dc_id] = c.session
+            return c.session
+        stale = c.media_sessions.pop(dc_id, None)
+        if stale is not None:
+            await stale.stop()
+        test_mode = await c.storage.test_mode()
+        ak = None if fresh else await session_store.media_auth_key(session_name(i), dc_id)
+        if ak:
+            ms = Session(c, dc_id, ak, test_mode, is_media=True)
+            await ms.start()
+        else:
+            ak = await Auth(c, dc_id, test_mode).create()
+            ms = Session(c, dc_id, ak, test_mode, is_media=True)
+            await ms.start()
+            ea = await c.invoke(raw.functions.auth.ExportAuthorization(dc_id=dc_id))
+            await ms.invoke(raw.functions.auth.ImportAuthorization(id=ea.id, bytes=ea.bytes))
+            await session_store.save_media_auth_key(session_name(i), dc_id, ak)
+        c.media_sessions[dc_id] = ms
+        return ms
+
     async def yield_file(self, f: FileId, i: int, o: int, fc: int, lc: int, pc: int, cs: int):
         c = self.client
-        work_loads[i] += 1
-        if f.dc_id not in c.media_sessions:
-            if f.dc_id != await c.storage.dc_id():
-                ak = await Auth(c, f.dc_id, await c.storage.test_mode()).create()
-                ms = Session(c, f.dc_id, ak, await c.storage.test_mode(), is_media=True)
-                await ms.start()
-                ea = await c.invoke(raw.functions.auth.ExportAuthorization(dc_id=f.dc_id))
-                await ms.invoke(raw.functions.auth.ImportAuthorization(id=ea.id, bytes=ea.bytes))
-                c.media_sessions[f.dc_id] = ms
-            else:
-                c.media_sessions[f.dc_id] = c.session
-
-        ms = c.media_sessions[f.dc_id]
+        set_load(i, work_loads[i] + 1)
         loc = await self.get_location(f)
         cp = 1
+        reauthorised = False
         try:
+            ms = await self.media_session(i, f.dc_id)
             while cp <= pc:
-                r = await ms.invoke(raw.functions.upload.GetFile(location=loc, offset=o, limit=cs), retries=2)
+                try:
+                    r = await ms.invoke(raw.functions.upload.GetFile(location=loc, offset=o, limit=cs), retries=2)
+                except Unauthorized:
+                    # persisted media key no longer authorised on that DC: export/import once more
+                    if reauthorised or ms is c.session:
+                        raise
+                    reauthorised = True
+                    ms = await self.media_session(i, f.dc_id, fresh=True)
+                    continue
                 if isinstance(r, raw.types.upload.File):
                     chk = r.bytes
                     if not chk:
@@ -376,19 +608,54 @@ class ByteStreamer:
                 else:
                     break
         finally:
-            work_loads[i] -= 1
+            set_load(i, work_loads[i] - 1)
+
+
+handoff_client = None
+HANDOFF_RESPONSE_HEADERS = ("content-type", "content-length", "content-range", "accept-ranges", "content-disposition")
+
+
+async def hand_off(r: Request, base_url: str) -> StreamingResponse:
+    """Proxies a /dl request to another worker's loopback port (see workers.handoff_target)."""
+    global handoff_client
+    if handoff_client is None or handoff_client.is_closed:
+        handoff_client = httpx.AsyncClient(timeout=httpx.Timeout(None, connect=2))
+    headers = {workers.HANDOFF_HEADER: str(workers.WORKER_INDEX)}
+    if "range" in r.headers: headers["Range"] = r.headers["range"]
+    upstream = await handoff_client.send(handoff_client.build_request("GET", base_url + r.url.path, headers=headers), stream=True)
+    if upstream.status_code >= 400:
+        await upstream.aclose()
+        raise HTTPException(upstream.status_code)
+    return StreamingResponse(
+        upstream.aiter_raw(),
+        status_code=upstream.status_code,
+        headers={k: v for k, v in upstream.headers.items() if k.lower() in HANDOFF_RESPONSE_HEADERS},
+        background=BackgroundTask(upstream.aclose),
+    )
 
 
-@app.get("/dl/{mid}/{fname}")
-async def stream(r: Request, mid: int, fname: str):
+@app.get("/dl/{token}/{fname}")
+async def stream(r: Request, token: str, fname: str):
+    mid = resolve_message_id(token)
+    if mid is None:
+        raise HTTPException(403, "Link expired or invalid")
     if not work_loads:
-        raise HTTPException(503)
+        raise HTTPException(503, "Starting up, try again shortly", headers={"Retry-After": "5"})
     cid = min(work_loads, key=work_loads.get)
+    if workers.HANDOFF_HEADER not in r.headers and (target := workers.handoff_target(work_loads[cid])):
+        try:
+            return await hand_off(r, target)
+        except httpx.HTTPError as e:
+            log_event(f"handoff to {target} failed ({e}), serving locally")
     c = multi_clients[cid]
     tc = class_cache.get(c) or ByteStreamer(c)
     class_cache[c] = tc
     try:
         msg = await c.get_messages(Config.STORAGE_CHANNEL, mid)
+        if msg.empty:
+            # deleted from the storage channel: stop handing this id out to re-posts
+            await db.forget_stored_message(mid)
+            raise HTTPException(404)
         m = msg.document or msg.video or msg.audio
         fid = FileId.decode(m.file_id)
         fsize = m.file_size
@@ -419,19 +686,69 @@ async def stream(r: Request, mid: int, fname: str):
         raise HTTPException(404)
 
 
+async def store_media(message: Message):
+    """
+    Returns (storage_message_id, is_duplicate). A file already in STORAGE_CHANNEL (same
+    file_unique_id) is reused instead of being copied again, unless that storage message has
+    been deleted since.
+    """
+    media = message.document or message.video or message.audio
+    unique_id = getattr(media, "file_unique_id", "")
+    stored_id = await db.get_stored_file(unique_id)
+    if stored_id:
+        try:
+            stored = await message._client.get_messages(Config.STORAGE_CHANNEL, stored_id)
+        except Exception as e:
+            log_event(f"storage message {stored_id} not checked ({e}), reusing it")
+            return stored_id, True
+        if not stored.empty:
+            return stored_id, True
+        log_event(f"storage message {stored_id} was deleted, copying the file again")
+        await db.forget_stored_message(stored_id)
+    sent = await scheduler_for(message._client).call(
+        message.copy, chat=Config.STORAGE_CHANNEL, priority=PRIORITY_CHANNEL, chat_id=Config.STORAGE_CHANNEL
+    )
+    await db.save_stored_file(unique_id, sent.id)
+    return sent.id, False
+
+
+def storage_link(storage_id: int, media) -> str:
+    return sign_link(storage_id, media.file_name or "", int(media.file_size or 0), media.mime_type or "")
+
+
 async def handle_file_upload(message: Message):
     try:
-        sent = await message.copy(chat_id=Config.STORAGE_CHANNEL)
-        media = message.document or message.video or message.audio
-        safe_name = "".join(c for c in (media.file_name or "file") if c.isalnum() or c in ('.', '_', '-')).strip()
-        long_url = f"{Config.BASE_URL}/dl/{sent.id}/{safe_name}"
-        final_link = await get_shortlink(long_url)
-        await message.reply_text(
-            f"**✅ File Uploaded!**\n\n📥 **Download Link:**\n`{final_link}`",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("📥 Download Now", url=final_link)]]),
-        )
+        with trace("stream", message.id):
+            await upload_and_reply(message)
     except Exception:
-        await message.reply_text("Error processing file.")
+        await send_reply(message, "Error processing file.")
+
+
+async def upload_and_reply(message: Message):
+    with span("copy"):
+        storage_id, _ = await store_media(message)
+    media = message.document or message.video or message.audio
+    safe_name = "".join(c for c in (media.file_name or "file") if c.isalnum() or c in ('.', '_', '-')).strip()
+    long_url = f"{Config.BASE_URL}/dl/{storage_link(storage_id, media)}/{safe_name}"
+    reply = asyncio.get_running_loop().create_future()
+
+    def upload_reply(link):
+        return dict(
+            text=f"**✅ File Uploaded!**\n\n📥 **Download Link:**\n`{link}`",
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("📥 Download Now", url=link)]]),
+        )
+
+    async def swap_in_short_link(short_url):
+        sent_reply = await reply
+        await scheduler_for(bot).call(sent_reply.edit_text, chat=message.chat.id, priority=PRIORITY_BACKGROUND, **upload_reply(short_url))
+
+    try:
+        with span("shortener"):
+            final_link = await get_shortlink(long_url, storage_id, on_late=swap_in_short_link)
+        with span("reply"):
+            reply.set_result(await send_reply(message, **upload_reply(final_link)))
+    finally:
+        if not reply.done(): reply.cancel()  # no reply to edit: a late short link is dropped
 
 
 @bot.on_message(filters.private & (filters.document | filters.video | filters.audio))
@@ -445,35 +762,111 @@ async def channel_handler(client, m):
         log_event(f"channel {m.chat.id} skipped: not in allowed list")
         return
     try:
-        sent = await m.copy(chat_id=Config.STORAGE_CHANNEL)
-        media = m.document or m.video or m.audio
-        safe_name = "".join(c for c in (media.file_name or "file") if c.isalnum() or c in ('.', '_', '-')).strip()
-        final_link = await get_shortlink(f"{Config.BASE_URL}/dl/{sent.id}/{safe_name}")
-        cap = m.caption.html if m.caption else f"**{media.file_name}**"
-        await client.edit_message_caption(m.chat.id, m.id, f"{cap}\n\n🚀 **Download:** {final_link}")
-
-        if m.video or (m.document and (media.mime_type or "").startswith("video/")):
-            log_event(f"channel {m.chat.id}: scheduling screenshots for message {sent.id}")
-            asyncio.create_task(generate_and_store_screenshots(m, sent.id))
-        else:
-            log_event(f"channel {m.chat.id}: media is not video for message {sent.id}")
+        with trace("stream", m.id):
+            await ingest_channel_post(client, m)
     except Exception:
         print("[channel_handler] Error while processing channel media")
         traceback.print_exc()
 
 
+async def ingest_channel_post(client, m: Message):
+    with span("copy"):
+        storage_id, duplicate = await store_media(m)
+    media = m.document or m.video or m.audio
+    safe_name = "".join(c for c in (media.file_name or "file") if c.isalnum() or c in ('.', '_', '-')).strip()
+    cap = m.caption.html if m.caption else f"**{media.file_name}**"
+
+    async def swap_in_short_link(short_url):
+        await scheduler_for(client).call(
+            client.edit_message_caption, m.chat.id, m.id, f"{cap}\n\n🚀 **Download:** {short_url}",
+            chat=m.chat.id, priority=PRIORITY_BACKGROUND,
+        )
+
+    with span("shortener"):
+        final_link = await get_shortlink(f"{Config.BASE_URL}/dl/{storage_link(storage_id, media)}/{safe_name}", storage_id,
+                                         on_late=swap_in_short_link)
+    with span("caption_edit"):
+        await scheduler_for(client).call(
+            client.edit_message_caption, m.chat.id, m.id, f"{cap}\n\n🚀 **Download:** {final_link}",
+            chat=m.chat.id, priority=PRIORITY_CHANNEL,
+        )
+
+    if duplicate:
+        log_event(f"channel {m.chat.id}: file already stored as message {storage_id}, screenshots skipped")
+    elif m.video or (m.document and (media.mime_type or "").startswith("video/")):
+        log_event(f"channel {m.chat.id}: scheduling screenshots for message {storage_id}")
+        asyncio.create_task(generate_and_store_screenshots(m, storage_id))
+    else:
+        log_event(f"channel {m.chat.id}: media is not video for message {storage_id}")
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/show/{link_id}")
+async def show_page(request: Request, link_id: str):
+    # The page is static; it loads its data from /api/file/{link_id}
+    return templates.TemplateResponse(request, "show.html")
+
+
+@app.get("/api/file/{link_id}")
+async def file_api(request: Request, link_id: str):
+    client = multi_clients[min(work_loads, key=work_loads.get)] if work_loads else None
+    info = await get_file_info(link_id, client)
+    if info is None:
+        raise HTTPException(404, "Link expired or invalid")
+    payload, etag = info
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={FILE_INFO_MAX_AGE}"}
+    if request.headers.get("If-None-Match") == etag:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(payload, headers=headers)
+
+
+async def batch_screenshots(keys: list):
+    if len(keys) > SCREENSHOT_BATCH_LIMIT:
+        raise HTTPException(400, f"At most {SCREENSHOT_BATCH_LIMIT} movie keys per request")
+    found = await screenshot_service.lookup_many(keys)
+    return {"results": {k: v for k, v in found.items() if v}, "missing": [k for k, v in found.items() if not v]}
+
+
+@app.post("/pella/webhook")
+async def pella_webhook(request: Request):
+    pella_main = sys.modules.get("pella_main")
+    if pella_main is None or pella_main.application is None:
+        raise HTTPException(503, "Pella bot is not running")
+    secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not hmac.compare_digest(secret.encode(), pella_main.PELLA_WEBHOOK_SECRET.encode()):
+        raise HTTPException(403)
+    try:
+        pella_main.feed_update(await request.json())
+    except asyncio.QueueFull:
+        # Telegram retries non-2xx deliveries, so a full queue just delays the update
+        raise HTTPException(503, "Ingestion queue full")
+    return {"ok": True}
+
+
+@app.get("/screenshots")
+async def get_screenshots_batch(keys: str = ""):
+    return await batch_screenshots([k for k in keys.split(",") if k.strip()])
+
+
+@app.post("/screenshots/batch")
+async def post_screenshots_batch(body: dict = Body(...)):
+    keys = body.get("keys")
+    if not isinstance(keys, list) or not all(isinstance(k, str) for k in keys):
+        raise HTTPException(400, "Body must be {\"keys\": [movie_key, ...]}")
+    return await batch_screenshots(keys)
+
+
 @app.get("/screenshots/{movie_key}")
 async def get_screenshots(movie_key: str):
     key = movie_key.lower().strip()
-    doc = await db.get_movie_screenshots(key)
-    if not doc:
+    payload = (await screenshot_service.lookup_many([key])).get(key)
+    if not payload:
         raise HTTPException(404, "Movie screenshots not found")
-    return {
-        "movie_key": doc.get("movie_key", key),
-        "best_quality": doc.get("best_quality", 0),
-        "screenshot_links": doc.get("screenshot_links", []),
-        "updatedAt": doc.get("updatedAt"),
-    }
+    return payload
 
 
 @app.api_route("/", methods=["GET", "POST", "HEAD"])
@@ -482,4 +875,7 @@ async def health(request: Request):
 
 
 if __name__ == "__main__":
-    uvicorn.run("app:app", host="0.0.0.0", port=int(os.environ.get("PORT", 8000)))
+    if workers.WEB_WORKERS > 1:
+        workers.run()
+    else:
+        uvicorn.run("app:app", host="0.0.0.0", port=int(os.environ.get("PORT", 8000)))
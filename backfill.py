@@ -0,0 +1,158 @@
+# backfill.py
+# Replays an existing channel's history into the Pella catalog
+# (pyrogram multi-client pool for fetching, pella_main pipeline for parsing/TMDB, batched bulk_write)
+
+import os
+import re
+import asyncio
+import logging
+import itertools
+from datetime import datetime
+from typing import List, Optional, Dict, Any
+
+from pyrogram.enums import MessageEntityType
+
+import pella_main as pm
+from metrics import span, trace
+
+logger = logging.getLogger("smart-bot")
+
+BACKFILL_FETCH_SIZE = 200  # get_messages limit per call
+BACKFILL_CONCURRENCY = int(os.getenv("BACKFILL_CONCURRENCY", "8"))
+BACKFILL_BATCH_POSTS = int(os.getenv("BACKFILL_BATCH_POSTS", "50"))
+
+jobs_collection = pm.db["backfill_jobs"]
+running_jobs: Dict[int, asyncio.Task] = {}
+title_index_lock = asyncio.Lock()
+
+
+def extract_urls_from_pyrogram(m) -> List[str]:
+    """pyrogram twin of pella_main.extract_urls."""
+    text = str(m.caption or "")
+    urls = re.findall(r'(https?://[^\s()<>]+)', text)
+    for ent in m.caption_entities or []:
+        if ent.type == MessageEntityType.URL:
+            urls.append(text[ent.offset : ent.offset + ent.length])
+        elif ent.type == MessageEntityType.TEXT_LINK:
+            urls.append(ent.url)
+    cleaned = []
+    for u in urls:
+        if not u: continue
+        u = u.strip().rstrip('.,)]')
+        if u.startswith('http') and u not in cleaned:
+            cleaned.append(u)
+    return cleaned
+
+
+def get_checkpoint(chat_id: int) -> Optional[Dict[str, Any]]:
+    return jobs_collection.find_one({"_id": chat_id})
+
+
+def save_checkpoint(chat_id: int, **fields):
+    fields["updatedAt"] = datetime.utcnow().isoformat() + "Z"
+    jobs_collection.update_one({"_id": chat_id}, {"$set": fields}, upsert=True)
+
+
+async def member_clients(clients: list, chat_id: int) -> list:
+    """Clients that can read the channel; a MULTI_TOKEN bot that is not a member would fail its chunks."""
+    async def can_read(c):
+        try:
+            await c.get_chat(chat_id)
+            return True
+        except Exception as e:
+            logger.warning(f"Backfill {chat_id}: skipping client {getattr(c, 'name', c)}: {e}")
+            return False
+    readable = await asyncio.gather(*(can_read(c) for c in clients))
+    return [c for c, ok in zip(clients, readable) if ok]
+
+
+async def ensure_title_index():
+    """The stream process never runs pella_main.main(), so the index that spares TMDB calls is loaded here."""
+    async with title_index_lock:
+        if not pm.title_index.loaded:
+            await asyncio.to_thread(pm.title_index.load, pm.collection)
+
+
+async def _post_ops(m, semaphore: asyncio.Semaphore):
+    media = m.video or m.document
+    async with semaphore:
+        try:
+            with trace("backfill", m.id):
+                ops, _ = await pm.build_post_ops(
+                    str(m.caption or ""), str(m.id), int(media.file_size or 0),
+                    extract_urls_from_pyrogram(m), take_screenshots=False,
+                )
+            return ops
+        except Exception as e:
+            logger.error(f"Backfill: message {m.id} failed: {e}")
+            return []
+
+
+async def _flush(ops: list) -> int:
+    if not ops: return 0
+    with span("mongo_write", "backfill"):
+        result = await asyncio.to_thread(pm.write_catalog_ops, ops)
+    return result.modified_count + result.upserted_count
+
+
+async def run_backfill(clients: list, chat_id: int, first_id: int, last_id: int, on_progress=None):
+    """
+    Walks [first_id, last_id] in get_messages chunks, rotating through the `clients` that can
+    read the channel. A checkpoint for the same range is resumed, any other range starts over.
+    The next chunk is fetched while the current one is parsed/resolved, ops are committed
+    every BACKFILL_BATCH_POSTS posts and the checkpoint only advances past committed chunks,
+    so a restarted job resumes from the last fully written chunk.
+    """
+    clients = await member_clients(clients, chat_id)
+    if not clients:
+        raise RuntimeError("no client can read this channel")
+    await ensure_title_index()
+
+    checkpoint = await asyncio.to_thread(get_checkpoint, chat_id) or {}
+    if (checkpoint.get("first_id"), checkpoint.get("last_id")) != (first_id, last_id):
+        checkpoint = {}  # a different range starts over, done_id belongs to the old one
+    start = max(first_id, int(checkpoint.get("done_id", first_id - 1)) + 1)
+    posts_total = int(checkpoint.get("posts", 0)) if start > first_id else 0
+    await asyncio.to_thread(save_checkpoint, chat_id, first_id=first_id, last_id=last_id, status="running",
+                            done_id=start - 1, posts=posts_total)
+    logger.info(f"Backfill {chat_id}: resuming at {start} (target {last_id}, {len(clients)} clients)")
+
+    client_cycle = itertools.cycle(clients)
+    semaphore = asyncio.Semaphore(BACKFILL_CONCURRENCY)
+
+    def fetch(chunk_start: int):
+        ids = list(range(chunk_start, min(chunk_start + BACKFILL_FETCH_SIZE, last_id + 1)))
+        return asyncio.create_task(next(client_cycle).get_messages(chat_id, ids))
+
+    pending = fetch(start) if start <= last_id else None
+    chunk_start = start
+    try:
+        while pending is not None:
+            messages = await pending
+            chunk_end = min(chunk_start + BACKFILL_FETCH_SIZE, last_id + 1) - 1
+            next_start = chunk_end + 1
+            pending = fetch(next_start) if next_start <= last_id else None
+
+            media_msgs = [m for m in messages if m and not m.empty and (m.video or m.document)]
+            for i in range(0, len(media_msgs), BACKFILL_BATCH_POSTS):
+                batch = media_msgs[i : i + BACKFILL_BATCH_POSTS]
+                results = await asyncio.gather(*(_post_ops(m, semaphore) for m in batch))
+                await _flush([op for ops in results for op in ops])
+                posts_total += len(batch)
+
+            await asyncio.to_thread(save_checkpoint, chat_id, done_id=chunk_end, posts=posts_total)
+            if on_progress: await on_progress(chunk_end, posts_total)
+            chunk_start = next_start
+
+        await asyncio.to_thread(save_checkpoint, chat_id, status="done")
+        logger.info(f"Backfill {chat_id}: finished, {posts_total} posts")
+        return posts_total
+    except asyncio.CancelledError:
+        if pending: pending.cancel()
+        await asyncio.to_thread(save_checkpoint, chat_id, status="paused")
+        raise
+    except Exception as e:
+        if pending: pending.cancel()
+        await asyncio.to_thread(save_checkpoint, chat_id, status=f"failed: {e}")
+        logger.exception(f"Backfill {chat_id} failed: {e}")
+        raise
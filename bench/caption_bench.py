@@ -0,0 +1,54 @@
+# bench/caption_bench.py
+# Regression check + throughput for caption_parser against bench/captions.jsonl
+#
+# Usage: python bench/caption_bench.py [--rounds 200]
+#
+# Expectations are maintained by hand (checked against the pre-unification Pella parser);
+# do not regenerate them from parse_caption, or the corpus only guards the current output.
+
+import os
+import sys
+import json
+import time
+import argparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from caption_parser import parse_caption
+
+CORPUS = os.path.join(HERE, "captions.jsonl")
+
+
+def load_corpus():
+    with open(CORPUS, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+    corpus = load_corpus()
+
+    failures = 0
+    for row in corpus:
+        got = parse_caption(row["caption"])
+        diff = {k: (v, got.get(k)) for k, v in row["expected"].items() if got.get(k) != v}
+        if diff:
+            failures += 1
+            print(f"MISMATCH {row['caption']!r}: " + ", ".join(f"{k}: expected {e!r} got {g!r}" for k, (e, g) in diff.items()))
+
+    captions = [row["caption"] for row in corpus]
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        for c in captions:
+            parse_caption(c)
+    elapsed = time.perf_counter() - started
+    total = args.rounds * len(captions)
+    print(f"{len(corpus)} captions, {failures} mismatches | {total / elapsed:,.0f} parses/s, {elapsed / total * 1e6:.1f} µs/parse")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
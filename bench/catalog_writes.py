@@ -0,0 +1,91 @@
+# bench/catalog_writes.py
+# Legacy read-modify-replace_one vs atomic build_catalog_ops for a season dump.
+#
+# Usage (needs a scratch MongoDB, the collection is dropped first):
+#   MONGODB_URI=mongodb://localhost:27017 python bench/catalog_writes.py --episodes 200 --threads 8
+
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("PELLA_BOT_TOKEN", "bench")
+os.environ.setdefault("TMDB_API_KEY", "bench")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bson
+from bson import ObjectId
+import pella_main as pm
+from recorded_ops import record_catalog_ops
+
+record_catalog_ops(pm)
+
+TMDB_STUB = {"id": 900001, "original_language": "en", "release_date": "2020-01-01", "overview": "x" * 400}
+
+
+def make_post(ep: int):
+    caption = f"Bench Show S01E{ep:02d} 720p"
+    new_doc, series_info = pm.build_mongo_document(TMDB_STUB, caption, str(ep), "720p")
+    tg = {"_id": ObjectId(), "quality": "720p", "fileId": str(ep)}
+    dl = [{"_id": ObjectId(), "link": f"https://example.com/dl/{ep}", "url": f"https://example.com/dl/{ep}", "quality": "720p"}]
+    return new_doc, series_info, tg, dl
+
+
+def legacy_write(col, ep: int) -> int:
+    """The pre-atomic path: full read, mutate in Python, replace the whole document."""
+    new_doc, series_info, tg, dl = make_post(ep)
+    existing = col.find_one({"tmdbId": new_doc["tmdbId"]})
+    doc = existing or new_doc
+    sn = series_info["season"]
+    season = next((s for s in doc["seasons"] if s["seasonNumber"] == sn), None)
+    if not season:
+        season = {"seasonNumber": sn, "episodes": [], "fullSeasonFiles": []}
+        doc["seasons"].append(season)
+    epi = next((e for e in season["episodes"] if e["episodeNumber"] == series_info["ep_num"]), None)
+    if not epi:
+        epi = {"episodeNumber": series_info["ep_num"], "title": series_info["title"], "telegramLinks": [tg], "downloadLinks": dl}
+        season["episodes"].append(epi)
+    if existing:
+        col.replace_one({"_id": existing["_id"]}, doc)
+    else:
+        col.insert_one(doc)
+    return len(bson.encode(doc))
+
+
+def atomic_write(col, ep: int) -> int:
+    new_doc, series_info, tg, dl = make_post(ep)
+    pm.collection = col
+    key, existing = pm.find_catalog_entry(new_doc, None)
+    ops = pm.build_catalog_ops(key, existing, new_doc, series_info, tg, dl)
+    col.bulk_write(ops, ordered=True)
+    return sum(len(bson.encode(op.update)) + len(bson.encode(op.filter)) for op in ops)
+
+
+def run(name, fn, col, episodes, threads):
+    col.drop()
+    fn(col, 0)  # create the entry so both paths start from an existing document
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        sizes = list(pool.map(lambda ep: fn(col, ep), range(1, episodes + 1)))
+    elapsed = time.perf_counter() - started
+    doc = col.find_one({"tmdbId": TMDB_STUB["id"]}) or {}
+    stored = sum(len(s.get("episodes", [])) for s in doc.get("seasons", []))
+    print(f"{name:8s} posts={episodes} threads={threads} time={elapsed:.2f}s "
+          f"per_post={elapsed / episodes * 1000:.1f}ms bytes_sent={sum(sizes) / 1024:.0f}KiB "
+          f"episodes_stored={stored}/{episodes + 1} lost={episodes + 1 - stored}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--episodes", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+    col = pm.client[os.getenv("BENCH_DB", "bench_catalog")]["movies"]
+    run("legacy", legacy_write, col, args.episodes, args.threads)
+    run("atomic", atomic_write, col, args.episodes, args.threads)
+    col.drop()
+
+
+if __name__ == "__main__":
+    main()
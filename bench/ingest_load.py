@@ -0,0 +1,447 @@
+# bench/ingest_load.py
+# Offline load test for both ingestion paths: pella_main.handle (Pella bot) and
+# app.channel_handler (stream bot), driven concurrently with synthetic channel posts.
+#
+# Stand-ins:
+#   - TMDB: local HTTP server (TMDB_API_BASE points at it) answering from --tmdb-fixtures
+#     (recorded {"search": {"<query>|<year>": [...]}, "movie": {"<id>": {...}}}) or synthesised
+#     results, with configurable latency / 429 rate
+#   - Mongo: a scratch database on a real server with --mongo-uri (dropped before and after the
+#     run); this is the baseline mode. Without it mongomock is used (`pip install mongomock`)
+#   - Telegram: synthetic PTB Updates / pyrogram-like messages built from bench/captions.jsonl;
+#     copy/edit calls sleep --tg-latency-ms and still go through tg_scheduler's rate limits.
+#     Screenshot jobs are replaced by a --screenshot-latency-ms sleep on both sides.
+#
+# Usage:
+#   python bench/ingest_load.py --posts 1000 --rate 600 --tmdb-latency-ms 250 --mongo-uri mongodb://localhost:27017
+#   python bench/ingest_load.py --posts 300 --concurrency 20 --allow-skipped-series   # in memory
+#
+# Notes: mongomock has no arrayFilters, so in memory mode series episode/pack pushes cannot be
+# applied. They are counted as "unsupported" and the run exits non-zero unless
+# --allow-skipped-series is given: such numbers do not cover the series write path.
+# Catalog lookups for a fresh scratch database start cold (empty title index).
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import logging
+import threading
+from types import SimpleNamespace
+from typing import Dict, List, Any
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+CORPUS = os.path.join(HERE, "captions.jsonl")
+SCRATCH_DB = "ingest_load_bench"
+STORAGE_CHANNEL = -1009999999999
+
+
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument("--posts", type=int, default=200, help="posts per ingestion path")
+    p.add_argument("--rate", type=float, default=0, help="arrivals per minute per path (0 = as fast as --concurrency allows)")
+    p.add_argument("--concurrency", type=int, default=16, help="posts in flight per path")
+    p.add_argument("--paths", default="pella,stream", help="comma separated: pella, stream")
+    p.add_argument("--channels", type=int, default=4, help="source channels the posts are spread over")
+    p.add_argument("--tmdb-latency-ms", type=float, default=120)
+    p.add_argument("--tmdb-jitter-ms", type=float, default=40)
+    p.add_argument("--tmdb-miss-rate", type=float, default=0.1, help="share of searches with no results")
+    p.add_argument("--tmdb-429-rate", type=float, default=0.0)
+    p.add_argument("--tmdb-fixtures", help="recorded TMDB responses (JSON)")
+    p.add_argument("--tg-latency-ms", type=float, default=80)
+    p.add_argument("--screenshot-latency-ms", type=float, default=0)
+    p.add_argument("--mongo-uri", help="scratch database on this server (baseline); mongomock if omitted")
+    p.add_argument("--allow-skipped-series", action="store_true", help="accept series ops mongomock cannot apply")
+    p.add_argument("--seed", type=int, default=7)
+    p.add_argument("--verbose", action="store_true")
+    return p.parse_args()
+
+
+# ---------------------------------------------------------------- fake TMDB
+
+def start_fake_tmdb(args, rng: random.Random):
+    import uvicorn
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse
+    from starlette.routing import Route
+
+    fixtures = {"search": {}, "movie": {}}
+    if args.tmdb_fixtures:
+        with open(args.tmdb_fixtures, encoding="utf-8") as f:
+            fixtures.update(json.load(f))
+    stats = {"search": 0, "movie": 0, "429": 0}
+    lock = threading.Lock()
+
+    def movie_id(title: str, year: str) -> int:
+        return 100000 + (hash((title.lower(), year)) % 900000)
+
+    async def delay():
+        await asyncio.sleep(max(0.0, rng.gauss(args.tmdb_latency_ms, args.tmdb_jitter_ms)) / 1000)
+
+    def throttled():
+        if rng.random() < args.tmdb_429_rate:
+            with lock: stats["429"] += 1
+            return JSONResponse({"status_code": 25}, status_code=429, headers={"Retry-After": "1"})
+        return None
+
+    async def search(request):
+        await delay()
+        if (r := throttled()): return r
+        with lock: stats["search"] += 1
+        query, year = request.query_params.get("query", ""), request.query_params.get("year", "")
+        recorded = fixtures["search"].get(f"{query}|{year}")
+        if recorded is not None:
+            return JSONResponse({"results": recorded})
+        if rng.random() < args.tmdb_miss_rate:
+            return JSONResponse({"results": []})
+        year = year or "2020"
+        return JSONResponse({"results": [{
+            "id": movie_id(query, year), "title": query, "original_title": query,
+            "release_date": f"{year}-06-01", "popularity": 50.0, "vote_count": 1000,
+            "original_language": "hi", "poster_path": "/bench.jpg",
+        }]})
+
+    async def movie(request):
+        await delay()
+        if (r := throttled()): return r
+        with lock: stats["movie"] += 1
+        mid = request.path_params["movie_id"]
+        recorded = fixtures["movie"].get(str(mid))
+        if recorded is not None:
+            return JSONResponse(recorded)
+        return JSONResponse({
+            "id": int(mid), "title": f"Bench {mid}", "release_date": "2020-06-01", "overview": "x" * 300,
+            "runtime": 140, "vote_average": 7.1, "tagline": "", "original_language": "hi",
+            "genres": [{"id": 18, "name": "Drama"}], "poster_path": "/p.jpg", "backdrop_path": "/b.jpg",
+            "credits": {"cast": [{"name": f"Actor {i}"} for i in range(12)], "crew": [{"job": "Director", "name": "Dir"}]},
+            "videos": {"results": [{"site": "YouTube", "type": "Trailer", "key": "bench"}]},
+        })
+
+    app = Starlette(routes=[Route("/search/movie", search), Route("/movie/{movie_id:int}", movie)])
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started: time.sleep(0.05)
+    return f"http://127.0.0.1:{sock.getsockname()[1]}", server, stats
+
+
+# ---------------------------------------------------------------- Mongo stand-ins
+
+class CountingCollection:
+    """Wraps the catalog collection: counts bulk writes; applies ops one by one under mongomock."""
+
+    def __init__(self, col, memory: bool):
+        self._col = col
+        self._memory = memory
+        self.counts = {"bulk_writes": 0, "ops": 0, "upserted": 0, "modified": 0, "unsupported": 0}
+
+    def __getattr__(self, name):
+        return getattr(self._col, name)
+
+    def bulk_write(self, ops, ordered=True):
+        self.counts["bulk_writes"] += 1
+        self.counts["ops"] += len(ops)
+        if not self._memory:
+            result = self._col.bulk_write(ops, ordered=ordered)
+            self.counts["upserted"] += result.upserted_count
+            self.counts["modified"] += result.modified_count
+            return result
+        upserted = modified = 0
+        for op in ops:  # RecordedUpdateOne, see setup_mongo
+            if op.array_filters:
+                self.counts["unsupported"] += 1
+                continue
+            r = self._col.update_one(op.filter, op.update, upsert=op.upsert)
+            upserted += 1 if r.upserted_id is not None else 0
+            modified += r.modified_count
+        self.counts["upserted"] += upserted
+        self.counts["modified"] += modified
+        return SimpleNamespace(upserted_count=upserted, modified_count=modified)
+
+
+class AsyncCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    async def to_list(self, length=None):
+        return list(self._cursor)
+
+
+class AsyncCollection:
+    """Just enough of motor's collection API over a mongomock collection for database.Database."""
+
+    def __init__(self, col):
+        self._col = col
+
+    def find(self, *args, **kwargs):
+        return AsyncCursor(self._col.find(*args, **kwargs))
+
+    def __getattr__(self, name):
+        method = getattr(self._col, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+
+def setup_mongo(args):
+    import pella_main as pm
+    import pella_commands
+    from database import db as stream_db
+    from recorded_ops import record_catalog_ops
+
+    stream_collections = ["links", "channels", "settings", "movie_screenshots", "media_probes", "short_links", "stored_files", "sessions"]
+    if args.mongo_uri:
+        import motor.motor_asyncio
+        from pymongo import MongoClient
+        sync_client = MongoClient(args.mongo_uri)
+        sync_client.drop_database(SCRATCH_DB)
+        sync_client.drop_database(SCRATCH_DB + "_stream")
+        catalog_db = sync_client[SCRATCH_DB]
+        stream_db.db = motor.motor_asyncio.AsyncIOMotorClient(args.mongo_uri)[SCRATCH_DB + "_stream"]
+        wrap = lambda name: stream_db.db[name]
+        cleanup = lambda: (sync_client.drop_database(SCRATCH_DB), sync_client.drop_database(SCRATCH_DB + "_stream"))
+    else:
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit("In-memory mode needs mongomock (pip install mongomock), or pass --mongo-uri")
+        mm = mongomock.MongoClient()
+        catalog_db = mm[SCRATCH_DB]
+        stream_mm = mm[SCRATCH_DB + "_stream"]
+        wrap = lambda name: AsyncCollection(stream_mm[name])
+        cleanup = lambda: None
+
+    record_catalog_ops(pm)
+    catalog = CountingCollection(catalog_db[pm.COL], memory=not args.mongo_uri)
+    pm.db, pm.collection, pm.ban_collection = catalog_db, catalog, catalog_db["banlist"]
+    pella_commands.ban_collection = catalog_db["banlist"]
+    catalog_db["banlist"].insert_one({"_id": "ban_config", "items": ["@somechannel", "join now", "t.me/somechannel"], "version": 1})
+
+    for name in stream_collections:
+        setattr(stream_db, name, wrap(name))
+    return catalog, cleanup
+
+
+# ---------------------------------------------------------------- synthetic posts
+
+def build_posts(n: int, rng: random.Random, channels: int) -> List[Dict[str, Any]]:
+    with open(CORPUS, encoding="utf-8") as f:
+        corpus = [json.loads(line)["caption"] for line in f if line.strip()]
+    posts = []
+    for i in range(n):
+        caption = corpus[i % len(corpus)]
+        # Re-posts of the same title in another quality are a large share of real traffic
+        if i >= len(corpus):
+            caption = f"{caption} {rng.choice(['480p', '720p', '1080p'])}"
+        posts.append({
+            "i": i,
+            "chat_id": -1001000000000 - (i % channels),
+            "message_id": 1000 + i,
+            "caption": f"{caption}\nDownload: https://dl.bench.local/dl/{i}/file.mkv\nJoin Now @somechannel",
+            "file_name": caption.replace(" ", ".") + ".mkv",
+            "file_size": rng.randint(300, 4000) * 1024 * 1024,
+            "file_unique_id": f"bench{i:06d}" if rng.random() > 0.1 else f"bench{i % 10:06d}",
+            "video": i % 2 == 0,
+        })
+    return posts
+
+
+def pella_update(post: Dict[str, Any]):
+    from telegram import Update
+    media = {"file_id": f"F{post['i']}", "file_unique_id": post["file_unique_id"], "file_size": post["file_size"]}
+    message = {
+        "message_id": post["message_id"], "date": int(time.time()),
+        "chat": {"id": post["chat_id"], "type": "channel", "title": "bench"},
+        "caption": post["caption"],
+    }
+    if post["video"]:
+        message["video"] = dict(media, width=1920, height=1080, duration=7200, file_name=post["file_name"])
+    else:
+        message["document"] = dict(media, file_name=post["file_name"], mime_type="video/x-matroska")
+    return Update.de_json({"update_id": post["i"], "channel_post": message}, None)
+
+
+class FakeCaption(str):
+    @property
+    def html(self):
+        return str(self)
+
+
+class FakeTelegram:
+    """The pyrogram surface channel_handler touches: message.copy and client.edit_message_caption."""
+
+    def __init__(self, latency_ms: float):
+        self.name = "bench-stream-bot"
+        self.latency = latency_ms / 1000
+        self.next_id = 1
+        self.counts = {"copy": 0, "edit_message_caption": 0}
+
+    async def edit_message_caption(self, chat_id, message_id, caption):
+        await asyncio.sleep(self.latency)
+        self.counts["edit_message_caption"] += 1
+
+    async def get_messages(self, chat_id, message_id):
+        # store_media checks dedup hits against the storage channel; nothing is ever deleted here
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(id=message_id, empty=False)
+
+    def message(self, post: Dict[str, Any]):
+        tg = self
+        media = SimpleNamespace(
+            file_id=f"F{post['i']}", file_unique_id=post["file_unique_id"], file_name=post["file_name"],
+            file_size=post["file_size"], mime_type="video/x-matroska",
+        )
+
+        async def copy(chat_id):
+            await asyncio.sleep(tg.latency)
+            tg.counts["copy"] += 1
+            tg.next_id += 1
+            return SimpleNamespace(id=tg.next_id)
+
+        return SimpleNamespace(
+            id=post["message_id"], chat=SimpleNamespace(id=post["chat_id"]), caption=FakeCaption(post["caption"]),
+            video=media if post["video"] else None, document=None if post["video"] else media, audio=None,
+            empty=False, _client=tg, copy=copy,
+        )
+
+
+# ---------------------------------------------------------------- driver
+
+async def drive(name: str, posts, handle_one, args) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies: List[float] = []
+    errors = 0
+    interval = 60 / args.rate if args.rate else 0
+
+    async def one(post):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await handle_one(post)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    tasks = []
+    for post in posts:
+        tasks.append(asyncio.create_task(one(post)))
+        if interval: await asyncio.sleep(interval)
+    await asyncio.gather(*tasks)
+    wall = time.perf_counter() - started
+    return {"path": name, "posts": len(posts), "errors": errors, "wall": wall, "latencies": sorted(latencies)}
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values: return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def report(results, catalog, telegram, screenshot_jobs, tmdb_stats):
+    import metrics
+    print("\n=== ingestion load test ===")
+    for r in results:
+        lat = r["latencies"]
+        # both handlers log and swallow their exceptions; the pipeline's `total` span still records them
+        total = metrics.histograms.get((r["path"], "total"))
+        r["errors"] += total.errors if total else 0
+        print(f"{r['path']:>6}: {r['posts']} posts in {r['wall']:.1f}s = {r['posts'] / r['wall'] * 60:.0f} posts/min, "
+              f"errors {r['errors']} | latency p50 {percentile(lat, .5):.2f}s p90 {percentile(lat, .9):.2f}s "
+              f"p99 {percentile(lat, .99):.2f}s max {lat[-1] if lat else 0:.2f}s")
+    print(f"catalog writes: {catalog.counts} | documents: {catalog.count_documents({})}")
+    if telegram:
+        print(f"telegram calls: {telegram.counts} | screenshot jobs: {screenshot_jobs}")
+    print(f"tmdb requests: {tmdb_stats}")
+    print("slowest stages:")
+    for line in metrics.summary(15):
+        print(f"  {line}")
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    paths = {p.strip() for p in args.paths.split(",") if p.strip()}
+
+    import pella_main as pm
+    import app
+    from config import Config
+    from pella_commands import ban_matcher
+
+    catalog, cleanup = setup_mongo(args)
+    await asyncio.to_thread(ban_matcher.load)
+    Config.STORAGE_CHANNEL = STORAGE_CHANNEL
+    Config.BASE_URL = "https://stream.bench.local"
+
+    screenshot_jobs = {"pella": 0, "stream": 0}
+
+    async def fake_screenshots(kind):
+        screenshot_jobs[kind] += 1
+        await asyncio.sleep(args.screenshot_latency_ms / 1000)
+
+    async def pella_attach(job):
+        await fake_screenshots("pella")
+
+    async def stream_generate(media, storage_message_id):
+        await fake_screenshots("stream")
+
+    pm.attach_screenshots = pella_attach
+    app.generate_and_store_screenshots = stream_generate
+    if not args.verbose:
+        app.log_event = lambda message: None
+
+    telegram = FakeTelegram(args.tg_latency_ms) if "stream" in paths else None
+    if telegram:
+        for i in range(args.channels):
+            await app.db.add_channel(-1001000000000 - i)
+
+    posts = build_posts(args.posts, rng, args.channels)
+    runs = []
+    if "pella" in paths:
+        runs.append(drive("pella", posts, lambda post: pm.handle(pella_update(post), None), args))
+    if "stream" in paths:
+        runs.append(drive("stream", posts, lambda post: app.channel_handler(telegram, telegram.message(post)), args))
+    try:
+        results = await asyncio.gather(*runs)
+    finally:
+        await pm.tmdb_client.close()
+    return results, catalog, telegram, screenshot_jobs, cleanup
+
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    tmdb_url, tmdb_server, tmdb_stats = start_fake_tmdb(args, rng)
+
+    # Everything below reads its configuration at import time
+    os.environ["TMDB_API_BASE"] = tmdb_url
+    os.environ.setdefault("PELLA_BOT_TOKEN", "1:bench")
+    os.environ.setdefault("TMDB_API_KEY", "bench")
+    os.environ.setdefault("MONGODB_URI", args.mongo_uri or "mongodb://127.0.0.1:1")
+    os.environ.setdefault("SLOW_POST_SECONDS", "3600")
+    os.environ.setdefault("EDIT_DEBOUNCE_SECONDS", "0")
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    for name in ("smart-bot", "httpx"):
+        logging.getLogger(name).setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    results, catalog, telegram, screenshot_jobs, cleanup = asyncio.run(run(args))
+    tmdb_server.should_exit = True
+    report(results, catalog, telegram, screenshot_jobs, tmdb_stats)
+    cleanup()
+    skipped = catalog.counts["unsupported"]
+    if skipped and not args.allow_skipped_series:
+        sys.exit(f"\n{skipped} series ops were not applied (mongomock has no arrayFilters); the series write "
+                 f"path was not measured. Use --mongo-uri, or --allow-skipped-series to accept it.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+# bench/recorded_ops.py
+# UpdateOne that keeps its arguments as public attributes. Benches install it as
+# pella_main.UpdateOne so build_catalog_ops output can be sized or replayed without
+# reaching into pymongo's private fields.
+
+from pymongo import UpdateOne
+
+
+class RecordedUpdateOne(UpdateOne):
+    def __init__(self, filter, update, upsert=None, array_filters=None, **kwargs):
+        super().__init__(filter, update, upsert=upsert, array_filters=array_filters, **kwargs)
+        self.filter = filter
+        self.update = update
+        self.upsert = bool(upsert)
+        self.array_filters = array_filters
+
+
+def record_catalog_ops(pella_main):
+    """build_catalog_ops looks UpdateOne up in its module, so patching the name is enough."""
+    pella_main.UpdateOne = RecordedUpdateOne
@@ -0,0 +1,151 @@
+# caption_parser.py
+# Single-pass caption/file-name parser shared by the stream bot (app.py) and the Pella bot
+
+import re
+import os
+from typing import Dict, Any, Optional, List
+
+RESOLUTIONS = ("2160p", "1440p", "1080p", "720p", "480p", "360p", "240p", "4k")
+RESOLUTION_VALUE = {"4k": 2160}
+# Order the Pella bot has always reported qualities in (highest first)
+QUALITY_PRIORITY = ("2160p", "4k", "1080p", "720p", "480p")
+
+QUALITY_TOKENS = [
+    r"bluray", r"blu[\-\s]?ray", r"hdrip", r"webrip", r"web[\-\s]?dl",
+    r"x264", r"x265", r"hevc", r"10bit", r"8bit",
+    r"uncut", r"esubs?", r"e\-?sub",
+    r"dual[\-\s]?audio", r"dubbed", r"hindi", r"english", r"malayalam",
+    r"tamil", r"telugu", r"kannada", r"hdtv", r"rip", r"dvdrip",
+    r"amzn", r"nf", r"ddp5\.1", r"aac5\.1",
+]
+
+MEDIA_EXTENSIONS = (".mkv", ".mp4", ".avi", ".m4v", ".mov", ".webm", ".ts")
+
+# One alternation, scanned once per caption. Group order matters: series tokens are tried
+# before quality tags so "s01e05" is never split into smaller matches.
+TOKEN_REGEX = re.compile(
+    r"(?P<season>(?<!')\b(?:season|s)\s?(?P<sn>\d{1,2})"
+    r"(?:\s?[\.\-_]?\s?(?:episode|ep|e)\s?(?P<ep>\d{1,3})(?:\s?-\s?(?:episode|ep|e)?\s?(?P<ep_end>\d{1,3}))?)?)(?!\d)"
+    r"|(?P<episode>\b(?:episode|ep|e)\s?(?P<ep_only>\d{1,3})(?:\s?-\s?(?:episode|ep|e)?\s?(?P<ep_only_end>\d{1,3}))?)(?!\d)"
+    r"|(?P<year>\b(?:19|20)\d{2}\b)"
+    r"|(?P<res>\b(?:" + "|".join(RESOLUTIONS) + r"))"
+    r"|(?P<tag>\b(?:" + "|".join(QUALITY_TOKENS) + r")\b)",
+    flags=re.IGNORECASE,
+)
+NON_ASCII_REGEX = re.compile(r"[^\x00-\x7F]+")
+SPACES_REGEX = re.compile(r"\s+")
+BRACKETS_REGEX = re.compile(r"\[.*?\]|\(.*?\)|\{.*?\}")
+NAME_JUNK_REGEX = re.compile(r"[^\w\s\-\.\:]")
+TAG_STRIP_REGEX = re.compile(r"\b(?:" + "|".join(QUALITY_TOKENS + list(RESOLUTIONS)) + r")\b", flags=re.IGNORECASE)
+KEY_SEPARATORS_REGEX = re.compile(r"[\s\._\-:]+")
+
+
+def _normalize(text: str) -> str:
+    text = (text or "").replace("\u2019", "'")  # typographic apostrophe, so "Ocean’s" stays possessive
+    return SPACES_REGEX.sub(" ", NON_ASCII_REGEX.sub(" ", text)).strip()
+
+
+def _clean_name(fragment: str) -> str:
+    fragment = TAG_STRIP_REGEX.sub(" ", fragment)
+    fragment = NAME_JUNK_REGEX.sub(" ", fragment)
+    return SPACES_REGEX.sub(" ", fragment).strip(" -.:")
+
+
+def _series_info(season: Optional[str], ep: Optional[str], ep_end: Optional[str]) -> Dict[str, Any]:
+    """
+    Same shape pella_main.analyze_series_info has always returned. Titles keep the caption's digits
+    ("Season 01 (Full)"): build_catalog_ops matches fullSeasonFiles by title.
+    """
+    info = {"is_series": False, "season": 1, "type": "episode", "ep_num": 1, "title": ""}
+    if season is None and ep is None:
+        return info
+    info["is_series"] = True
+    info["season"] = int(season) if season is not None else 1
+    if ep is not None and ep_end is not None:
+        info.update({"type": "pack", "title": f"Episodes {ep}-{ep_end}"})
+    elif ep is not None:
+        info.update({"type": "episode", "ep_num": int(ep), "title": f"Episode {ep}"})
+    else:
+        info.update({"type": "pack", "title": f"Season {season} (Full)"})
+    return info
+
+
+def parse_caption(text: str) -> Dict[str, Any]:
+    """
+    Tokenises the caption once and returns:
+      name, year, quality (Pella label, e.g. "1080p"), resolution (int, e.g. 1080),
+      series (analyze_series_info dict) and movie_key.
+    """
+    text = _normalize(text)
+    quality_tag = None
+    season = ep = ep_end = None
+    resolutions: List[str] = []
+    years: List[tuple] = []
+    stops: List[int] = []  # positions where the title part may end
+
+    for m in TOKEN_REGEX.finditer(text):
+        kind = m.lastgroup
+        if kind == "year":
+            years.append((m.start(), m.group("year")))
+            stops.append(m.start())
+        elif kind == "res":
+            resolutions.append(m.group("res").lower())
+            stops.append(m.start())
+        elif kind == "tag":
+            if quality_tag is None: quality_tag = m.group("tag").lower()
+        elif kind == "season":
+            if season is None:
+                season = m.group("sn")
+                if m.group("ep"):
+                    ep, ep_end = m.group("ep"), m.group("ep_end")
+            stops.append(m.start())
+        elif ep is None:
+            ep, ep_end = m.group("ep_only"), m.group("ep_only_end")
+            stops.append(m.start())
+
+    # Title is whatever precedes the first year/series/resolution token that leaves a non-empty name
+    # ("2012 (2009)" -> name "2012", year "2009")
+    name, name_end = "", 0
+    for pos in sorted(set(stops)):
+        name, name_end = _clean_name(text[:pos]), pos
+        if name: break
+    if not name:
+        name = _clean_name(BRACKETS_REGEX.sub(" ", text))
+    year = next((y for pos, y in years if pos >= name_end), None)
+    name = " ".join(w.capitalize() for w in name.split())
+
+    quality = next((q for q in QUALITY_PRIORITY if q in resolutions), resolutions[0] if resolutions else (quality_tag or ""))
+    resolution = max((RESOLUTION_VALUE.get(r) or int(r[:-1]) for r in resolutions), default=0)
+
+    return {
+        "name": name,
+        "year": year,
+        "quality": quality,
+        "resolution": resolution,
+        "series": _series_info(season, ep, ep_end),
+        "movie_key": build_movie_key(name, year),
+    }
+
+
+def build_movie_key(name: str, year: Optional[str]) -> str:
+    """The one key both bots use for movie_screenshots and catalog joins."""
+    key = KEY_SEPARATORS_REGEX.sub(" ", (name or "").lower()).strip()
+    if not key: return "unknown_movie"
+    return f"{key} {year}"[:120] if year else key[:120]
+
+
+def parse_file_name(file_name: str) -> Dict[str, Any]:
+    """Release-style file names use dots/underscores as spaces and carry an extension."""
+    base, ext = os.path.splitext(file_name or "")
+    if ext.lower() not in MEDIA_EXTENSIONS: base = file_name or ""
+    return parse_caption(re.sub(r"[\._]+", " ", base))
+
+
+def parse_media(file_name: str, caption: str = "") -> Dict[str, Any]:
+    """File name first (it is what uploaders rarely edit), caption as fallback/extra quality source."""
+    primary = parse_file_name(file_name) if file_name else parse_caption(caption)
+    if file_name and caption:
+        secondary = parse_caption(caption)
+        if secondary["resolution"] > primary["resolution"]:
+            primary["resolution"] = secondary["resolution"]
+    return primary
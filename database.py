@@ -1,15 +1,31 @@
 # database.py (FINAL UPDATED VERSION)
+import os
+import asyncio
+from datetime import datetime, timedelta, timezone
 import motor.motor_asyncio
 from config import Config
+from cache import TTLCache, MISSING
+from mongo_indexes import STREAM_INDEXES, index_models, index_report
+
+CONFIG_CACHE_TTL = int(os.environ.get("CONFIG_CACHE_TTL", 300))
 
 class Database:
     def __init__(self):
+        # channel allow-list + shortener config; invalidated by the admin commands and by
+        # the change-stream watcher, TTL bounds staleness when change streams are unavailable
+        self.config_cache = TTLCache(CONFIG_CACHE_TTL)
+        self._watch_task = None
+        self._index_task = None
         self._client = None
         self.db = None
         self.links = None
         self.channels = None
         self.settings = None
         self.movie_screenshots = None
+        self.media_probes = None
+        self.short_links = None
+        self.stored_files = None
+        self.sessions = None
 
     async def connect(self):
         if Config.DATABASE_URL:
@@ -19,7 +35,54 @@ class Database:
             self.channels = self.db["channels"]
             self.settings = self.db["settings"]
             self.movie_screenshots = self.db["movie_screenshots"]
+            self.media_probes = self.db["media_probes"]
+            self.short_links = self.db["short_links"]
+            self.stored_files = self.db["stored_files"]
+            self.sessions = self.db["sessions"]
             print("✅ Database Connected!")
+            # index bootstrap is slow on a cold cluster and nothing waits on it
+            self._index_task = asyncio.create_task(self.ensure_indexes())
+            self._watch_task = asyncio.create_task(self.watch_config_changes())
+
+    async def watch_config_changes(self):
+        """Drops cached config when another instance edits channels/settings (needs a replica set)."""
+        pipeline = [{'$match': {'ns.coll': {'$in': ['channels', 'settings']}}}]
+        delay = 5
+        while True:
+            try:
+                async with self.db.watch(pipeline) as stream:
+                    delay = 5
+                    async for change in stream:
+                        coll = change['ns']['coll']
+                        doc_id = change.get('documentKey', {}).get('_id')
+                        if coll == 'channels': self.config_cache.pop(('channel', doc_id))
+                        elif doc_id == 'shortener_config': self.config_cache.pop('shortener')
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if 'replica' in str(e).lower() or getattr(e, 'code', None) == 40573:
+                    print("ℹ️ Change streams unavailable, config cache relies on TTL only.")
+                    return
+                print(f"⚠️ Config watch interrupted: {e}")
+                self.config_cache.clear()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 300)
+
+    async def ensure_indexes(self):
+        """Creates declared indexes (idempotent) and logs missing/undeclared/unused ones."""
+        for name, declared in STREAM_INDEXES.items():
+            col = self.db[name]
+            try:
+                if declared: await col.create_indexes(index_models(declared))
+                existing = list((await col.index_information()).keys())
+                try: stats = await col.aggregate([{'$indexStats': {}}]).to_list(None)
+                except Exception: stats = []
+                for line in index_report(name, declared, existing, stats): print(f"⚠️ Index: {line}")
+            except Exception as e:
+                print(f"⚠️ Index setup failed for {name}: {e}")
+        # memo rows keyed by the long URL predate expiresAt, so the TTL index never removes them
+        try: await self.short_links.delete_many({'expiresAt': {'$exists': False}})
+        except Exception as e: print(f"⚠️ short_links cleanup failed: {e}")
 
     async def save_link(self, unique_id, message_id):
         if self.links is not None: await self.links.insert_one({'_id': unique_id, 'message_id': message_id})
@@ -32,32 +95,49 @@ class Database:
 
     async def add_channel(self, channel_id):
         if self.channels is not None: await self.channels.update_one({'_id': channel_id}, {'$set': {'_id': channel_id}}, upsert=True)
+        self.config_cache.pop(('channel', channel_id))
 
     async def remove_channel(self, channel_id):
         if self.channels is not None: await self.channels.delete_one({'_id': channel_id})
+        self.config_cache.pop(('channel', channel_id))
 
     async def is_channel_allowed(self, channel_id):
+        cached = self.config_cache.get(('channel', channel_id))
+        if cached is not MISSING: return cached
         if self.channels is not None:
-            doc = await self.channels.find_one({'_id': channel_id})
-            return doc is not None
+            allowed = await self.channels.find_one({'_id': channel_id}, {'_id': 1}) is not None
+            self.config_cache.set(('channel', channel_id), allowed)
+            return allowed
         return False
 
     async def set_shortener(self, api_url, api_key):
         if self.settings is not None:
             await self.settings.update_one({'_id': 'shortener_config'}, {'$set': {'api_url': api_url, 'api_key': api_key}}, upsert=True)
+        self.config_cache.pop('shortener')
 
     async def get_shortener(self):
-        if self.settings is not None: return await self.settings.find_one({'_id': 'shortener_config'})
+        cached = self.config_cache.get('shortener')
+        if cached is not MISSING: return cached
+        if self.settings is not None:
+            doc = await self.settings.find_one({'_id': 'shortener_config'})
+            self.config_cache.set('shortener', doc)
+            return doc
         return None
 
     async def del_shortener(self):
         if self.settings is not None: await self.settings.delete_one({'_id': 'shortener_config'})
+        self.config_cache.pop('shortener')
 
     async def get_movie_screenshots(self, movie_key):
         if self.movie_screenshots is not None:
             return await self.movie_screenshots.find_one({'_id': movie_key})
         return None
 
+    async def get_movie_screenshots_many(self, movie_keys, projection=None):
+        if self.movie_screenshots is not None:
+            return await self.movie_screenshots.find({'_id': {'$in': list(movie_keys)}}, projection).to_list(None)
+        return []
+
     async def upsert_movie_screenshots(self, movie_key, payload):
         if self.movie_screenshots is not None:
             await self.movie_screenshots.update_one(
@@ -66,4 +146,71 @@ class Database:
                 upsert=True
             )
 
+    async def get_media_probe(self, file_unique_id):
+        if self.media_probes is not None:
+            return await self.media_probes.find_one({'_id': file_unique_id}, {'_id': 0})
+        return None
+
+    async def save_media_probe(self, file_unique_id, info):
+        if self.media_probes is not None:
+            await self.media_probes.update_one({'_id': file_unique_id}, {'$set': info}, upsert=True)
+
+    async def get_short_link(self, message_id, api_url):
+        if self.short_links is not None:
+            # the TTL monitor only sweeps once a minute, so expiry is checked on read as well
+            doc = await self.short_links.find_one({'_id': {'message_id': message_id, 'api_url': api_url},
+                                                   'expiresAt': {'$gt': datetime.now(timezone.utc)}})
+            return doc.get('short_url') if doc else None
+        return None
+
+    async def save_short_link(self, message_id, api_url, short_url, ttl):
+        if self.short_links is not None:
+            await self.short_links.update_one(
+                {'_id': {'message_id': message_id, 'api_url': api_url}},
+                {'$set': {'short_url': short_url, 'expiresAt': datetime.now(timezone.utc) + timedelta(seconds=ttl)}},
+                upsert=True,
+            )
+
+    async def get_stored_file(self, file_unique_id):
+        if self.stored_files is not None and file_unique_id:
+            doc = await self.stored_files.find_one({'_id': file_unique_id}, {'message_id': 1})
+            return doc.get('message_id') if doc else None
+        return None
+
+    async def save_stored_file(self, file_unique_id, message_id):
+        # $setOnInsert: if two posts of the same file race, the first stored copy wins
+        if self.stored_files is not None and file_unique_id:
+            await self.stored_files.update_one(
+                {'_id': file_unique_id},
+                {'$setOnInsert': {'message_id': message_id, 'storedAt': datetime.now(timezone.utc)}},
+                upsert=True,
+            )
+
+    async def get_stored_file_time(self, file_unique_id):
+        """When the file was first copied to storage (naive UTC), None if it never was; rows from before storedAt count as old."""
+        if self.stored_files is not None and file_unique_id:
+            doc = await self.stored_files.find_one({'_id': file_unique_id}, {'storedAt': 1})
+            if doc:
+                return doc.get('storedAt', datetime.min).replace(tzinfo=None)
+        return None
+
+    async def get_stored_file_id(self, message_id):
+        if self.stored_files is not None:
+            doc = await self.stored_files.find_one({'message_id': message_id}, {'_id': 1})
+            return doc['_id'] if doc else None
+        return None
+
+    async def forget_stored_message(self, message_id):
+        if self.stored_files is not None: await self.stored_files.delete_many({'message_id': message_id})
+
+    async def get_session(self, name):
+        if self.sessions is not None:
+            return await self.sessions.find_one({'_id': name})
+        return None
+
+    async def save_session(self, name, fields, replace=False):
+        if self.sessions is not None:
+            if replace: await self.sessions.replace_one({'_id': name}, fields, upsert=True)
+            else: await self.sessions.update_one({'_id': name}, {'$set': fields}, upsert=True)
+
 db = Database()
@@ -0,0 +1,101 @@
+# file_info.py
+# Metadata behind the show page (/api/file/{id}): resolved once per link and kept in a TTL cache,
+# so repeat visitors cost neither a Telegram call nor Mongo reads
+
+import os
+import json
+import hashlib
+from typing import Dict, Any, Optional
+
+from config import Config
+from database import db
+from cache import TTLCache, MISSING
+from caption_parser import parse_media
+from signed_links import verify_link, sign_link, ALLOW_LEGACY_LINKS
+
+FILE_INFO_TTL = int(os.environ.get("FILE_INFO_TTL", 600))
+FILE_INFO_MISS_TTL = 30
+FILE_INFO_CACHE_SIZE = 4096
+
+# link id -> (payload, etag) or None for links that did not resolve
+file_info_cache = TTLCache(FILE_INFO_TTL, FILE_INFO_CACHE_SIZE)
+
+
+def get_readable_file_size(size: int) -> str:
+    size = float(size or 0)
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024: return f"{size:.2f} {unit}"
+        size /= 1024
+    return f"{size:.2f} TB"
+
+
+def mask_filename(name: str) -> str:
+    """Obfuscates the filename to hide it in the URL/page."""
+    if not name: return "Protected File"
+    resolutions = ["216_p", "480p", "720p", "1080p", "2160p"]
+    res_part = ""
+    for res in resolutions:
+        if res in name:
+            res_part = f" {res}"
+            name = name.replace(res, "")
+            break
+    base, ext = os.path.splitext(name)
+    masked_base = ''.join(c if (i % 3 == 0 and c.isalnum()) else '*' for i, c in enumerate(base))
+    return f"{masked_base}{res_part}{ext}"
+
+
+async def _lookup_media(client, message_id: int) -> Optional[Dict[str, Any]]:
+    msg = await client.get_messages(Config.STORAGE_CHANNEL, message_id)
+    media = None if msg.empty else (msg.document or msg.video or msg.audio)
+    if not media: return None
+    return {"file_name": media.file_name or "file", "file_size": int(media.file_size or 0),
+            "mime_type": media.mime_type or "", "file_unique_id": media.file_unique_id}
+
+
+async def build_file_info(link_id: str, client) -> Optional[Dict[str, Any]]:
+    """
+    Signed links already carry name/size/mime; legacy ids (message id or saved unique id)
+    fall back to db.get_link and one get_messages call on `client`, while ALLOW_LEGACY_LINKS is on.
+    """
+    link = verify_link(link_id)
+    if link and link["file_name"]:
+        message_id = link["message_id"]
+        media = dict(link, file_unique_id=await db.get_stored_file_id(message_id))
+    else:
+        if not link and not ALLOW_LEGACY_LINKS: return None
+        message_id = link["message_id"] if link else int(link_id) if link_id.isdigit() else await db.get_link(link_id)
+        if not message_id or client is None: return None
+        media = await _lookup_media(client, message_id)
+        if not media: return None
+        link_id = sign_link(message_id, media["file_name"], media["file_size"], media["mime_type"])
+
+    parsed = parse_media(media["file_name"])
+    probe = await db.get_media_probe(media["file_unique_id"]) if media["file_unique_id"] else None
+    shots = await db.get_movie_screenshots(parsed["movie_key"])
+    safe_name = "".join(c for c in media["file_name"] if c.isalnum() or c in ('.', '_', '-')).strip()
+    mime_type = media["mime_type"]
+    return {
+        "file_name": mask_filename(media["file_name"]),
+        "file_size": get_readable_file_size(media["file_size"]),
+        "size_bytes": media["file_size"],
+        "mime_type": mime_type,
+        "is_media": mime_type.startswith(("video/", "audio/")),
+        "duration": round((probe or {}).get("duration", 0.0), 2),
+        "quality": (probe or {}).get("quality") or parsed["resolution"],
+        "screenshots": (shots or {}).get("screenshot_links", []),
+        "direct_dl_link": f"{Config.BASE_URL}/dl/{link_id}/{safe_name}",
+    }
+
+
+async def get_file_info(link_id: str, client) -> Optional[tuple]:
+    """(payload, etag) for a link id, None if it does not resolve."""
+    cached = file_info_cache.get(link_id)
+    if cached is not MISSING:
+        return cached
+    payload = await build_file_info(link_id, client)
+    if payload is None:
+        file_info_cache.set(link_id, None, FILE_INFO_MISS_TTL)
+        return None
+    etag = '"' + hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:20] + '"'
+    file_info_cache.set(link_id, (payload, etag))
+    return payload, etag
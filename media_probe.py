@@ -0,0 +1,94 @@
+# media_probe.py
+# Container metadata (duration, resolution, codecs, bitrate, audio tracks) read through the
+# streaming layer: ffmpeg opens the /dl URL and only pulls the header/index byte ranges it needs.
+
+import os
+import re
+import asyncio
+import functools
+from typing import Dict, Any, List, Optional, Tuple
+
+from database import db
+from signed_links import sign_link
+
+PROBE_TIMEOUT = 60
+STREAM_LOCAL_URL = os.environ.get("STREAM_LOCAL_URL", f"http://127.0.0.1:{os.environ.get('PORT', 8000)}").rstrip('/')
+
+DURATION_REGEX = re.compile(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)(?:.*?bitrate:\s*(\d+)\s*kb/s)?")
+VIDEO_REGEX = re.compile(r"Stream #\d+:\d+(?:\[\w+\])?(?:\((\w+)\))?: Video: (\w+).*?(\d{2,5})x(\d{2,5})(?:.*?([\d.]+) fps)?")
+AUDIO_REGEX = re.compile(r"Stream #\d+:\d+(?:\[\w+\])?(?:\((\w+)\))?: Audio: (\w+)(?:.*?(\d+) Hz)?(?:, ([\w.()]+))?")
+
+
+@functools.lru_cache(maxsize=1)
+def ffmpeg_binary() -> str:
+    """Bundled imageio-ffmpeg binary (the slim Docker image has no system ffmpeg), else PATH."""
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return 'ffmpeg'
+
+
+async def run_ffmpeg(args: List[str], timeout: float) -> Tuple[int, str]:
+    """Runs ffmpeg without blocking the event loop; returns (returncode, stderr)."""
+    proc = await asyncio.create_subprocess_exec(ffmpeg_binary(), *args, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+    try:
+        _, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return -1, "timeout"
+    return proc.returncode, (stderr or b"").decode(errors="ignore")
+
+
+def parse_ffmpeg_info(output: str) -> Dict[str, Any]:
+    """Parses the stream summary `ffmpeg -i` prints to stderr."""
+    info: Dict[str, Any] = {"duration": 0.0, "bitrate": 0, "video_codec": "", "width": 0, "height": 0, "fps": 0.0, "audio_tracks": []}
+    m = DURATION_REGEX.search(output or "")
+    if m:
+        h, mi, sec, bitrate = m.groups()
+        info["duration"] = int(h) * 3600 + int(mi) * 60 + float(sec)
+        info["bitrate"] = int(bitrate or 0)
+    v = VIDEO_REGEX.search(output or "")
+    if v:
+        _, codec, width, height, fps = v.groups()
+        info.update({"video_codec": codec, "width": int(width), "height": int(height), "fps": float(fps or 0)})
+    tracks: List[Dict[str, Any]] = []
+    for a in AUDIO_REGEX.finditer(output or ""):
+        lang, codec, rate, channels = a.groups()
+        tracks.append({"language": lang or "", "codec": codec, "sample_rate": int(rate or 0), "channels": channels or ""})
+    info["audio_tracks"] = tracks
+    return info
+
+
+def quality_from_resolution(width: int, height: int) -> int:
+    """Standard label for a frame size; uses width too so letterboxed 1920x800 still counts as 1080p."""
+    effective = max(height or 0, int((width or 0) * 9 / 16))
+    for label, floor in ((2160, 2000), (1440, 1300), (1080, 900), (720, 650), (480, 450), (360, 320)):
+        if effective >= floor: return label
+    return 240 if effective > 0 else 0
+
+
+async def probe_url(url: str) -> Optional[Dict[str, Any]]:
+    _, stderr = await run_ffmpeg(['-hide_banner', '-i', url], PROBE_TIMEOUT)
+    info = parse_ffmpeg_info(stderr)
+    if not info["duration"] and not info["height"]:
+        return None
+    info["quality"] = quality_from_resolution(info["width"], info["height"])
+    return info
+
+
+async def cached_probe(url: str, file_unique_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    """probe_url through the media_probes cache, keyed by file_unique_id; probes and stores only on a miss."""
+    if file_unique_id:
+        cached = await db.get_media_probe(file_unique_id)
+        if cached: return cached
+    info = await probe_url(url)
+    if info and file_unique_id:
+        await db.save_media_probe(file_unique_id, info)
+    return info
+
+
+async def probe_message(storage_message_id: int, file_unique_id: str) -> Optional[Dict[str, Any]]:
+    """Cached probe of a storage-channel file."""
+    return await cached_probe(f"{STREAM_LOCAL_URL}/dl/{sign_link(storage_message_id)}/probe", file_unique_id)
@@ -0,0 +1,162 @@
+# metrics.py
+# Span-style stage timings for both ingestion pipelines: every span feeds a per-stage histogram
+# (/metrics, /status) and, when it runs inside a trace, the per-post breakdown used for the
+# slow-post log. In-process only; each worker/Pella process keeps its own numbers.
+
+import os
+import json
+import time
+import bisect
+import asyncio
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+SLOW_POST_SECONDS = float(os.environ.get("SLOW_POST_SECONDS", 60))
+SLOW_POST_LOG = os.environ.get("SLOW_POST_LOG", "")  # JSON lines file; empty = print only
+CANCELLED = "cancelled"  # deliberate cancellation (e.g. the losing TMDB candidate search), not an error
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 120000)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)  # last bucket is +Inf
+        self.total_ms = 0.0
+        self.count = 0
+        self.errors = 0
+        self.cancelled = 0
+
+    def observe(self, ms: float, outcome: str = "ok"):
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.total_ms += ms
+        self.count += 1
+        if outcome == CANCELLED: self.cancelled += 1
+        elif outcome != "ok": self.errors += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation (ms)."""
+        if not self.count: return 0.0
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return float(BUCKETS_MS[i]) if i < len(BUCKETS_MS) else float("inf")
+        return float("inf")
+
+
+# (pipeline, stage) -> Histogram
+histograms: Dict[Tuple[str, str], Histogram] = {}
+current_trace: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+
+
+class Trace:
+    def __init__(self, pipeline: str, post_id):
+        self.pipeline = pipeline
+        self.post_id = post_id
+        self.started = time.perf_counter()
+        self.spans: List[Tuple[str, float, str]] = []
+
+
+def record(pipeline: str, stage: str, ms: float, outcome: str = "ok"):
+    histograms.setdefault((pipeline, stage), Histogram()).observe(ms, outcome)
+
+
+def _outcome(e: BaseException) -> str:
+    return CANCELLED if isinstance(e, asyncio.CancelledError) else type(e).__name__
+
+
+@contextmanager
+def span(stage: str, pipeline: Optional[str] = None):
+    """Times a block; the pipeline defaults to the enclosing trace's."""
+    trace = current_trace.get()
+    pipeline = pipeline or (trace.pipeline if trace else "misc")
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException as e:
+        outcome = _outcome(e)
+        raise
+    finally:
+        ms = (time.perf_counter() - started) * 1000
+        record(pipeline, stage, ms, outcome)
+        if trace is not None and trace.pipeline == pipeline:
+            trace.spans.append((stage, ms, outcome))
+
+
+@contextmanager
+def trace(pipeline: str, post_id):
+    """One post through a pipeline: records a `total` span and logs the breakdown when slow."""
+    t = Trace(pipeline, post_id)
+    token = current_trace.set(t)
+    outcome = "ok"
+    try:
+        yield t
+    except BaseException as e:
+        outcome = _outcome(e)
+        raise
+    finally:
+        current_trace.reset(token)
+        total = time.perf_counter() - t.started
+        record(pipeline, "total", total * 1000, outcome)
+        if total >= SLOW_POST_SECONDS:
+            _log_slow(t, total, outcome)
+
+
+def _log_slow(t: Trace, total: float, outcome: str):
+    entry = {
+        "at": datetime.now(timezone.utc).isoformat(),
+        "pipeline": t.pipeline,
+        "post": str(t.post_id),
+        "total_s": round(total, 2),
+        "outcome": outcome,
+        "stages": [{"stage": s, "ms": round(ms, 1), "outcome": o} for s, ms, o in t.spans],
+    }
+    line = json.dumps(entry, ensure_ascii=False)
+    print(f"[slow-post] {line}")
+    if SLOW_POST_LOG:
+        try:
+            with open(SLOW_POST_LOG, "a") as f: f.write(line + "\n")
+        except OSError:
+            pass
+
+
+def render_prometheus() -> str:
+    rows = sorted(histograms.items())
+    lines = [
+        "# HELP ingest_stage_seconds Duration of ingestion pipeline stages",
+        "# TYPE ingest_stage_seconds histogram",
+    ]
+    for (pipeline, stage), h in rows:
+        labels = f'pipeline="{pipeline}",stage="{stage}"'
+        cumulative = 0
+        for bound, n in zip(BUCKETS_MS, h.counts):
+            cumulative += n
+            lines.append(f'ingest_stage_seconds_bucket{{{labels},le="{bound / 1000:g}"}} {cumulative}')
+        lines.append(f'ingest_stage_seconds_bucket{{{labels},le="+Inf"}} {h.count}')
+        lines.append(f"ingest_stage_seconds_sum{{{labels}}} {h.total_ms / 1000:.6f}")
+        lines.append(f"ingest_stage_seconds_count{{{labels}}} {h.count}")
+    for name, help_text, attr in (
+        ("ingest_stage_errors_total", "Ingestion stages that raised", "errors"),
+        ("ingest_stage_cancelled_total", "Ingestion stages that were cancelled", "cancelled"),
+    ):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for (pipeline, stage), h in rows:
+            lines.append(f'{name}{{pipeline="{pipeline}",stage="{stage}"}} {getattr(h, attr)}')
+    return "\n".join(lines) + "\n"
+
+
+def summary(limit: int = 12) -> List[str]:
+    """Slowest stages by total time spent, one line each, for /status."""
+    rows = sorted(histograms.items(), key=lambda kv: kv[1].total_ms, reverse=True)[:limit]
+    lines = []
+    for (pipeline, stage), h in rows:
+        p50, p95 = h.quantile(0.5), h.quantile(0.95)
+        lines.append(
+            f"{pipeline}/{stage}: n={h.count} avg={h.total_ms / h.count / 1000:.2f}s "
+            f"p50≤{p50 / 1000:g}s p95≤{p95 / 1000:g}s err={h.errors}"
+            + (f" cancelled={h.cancelled}" if h.cancelled else "")
+        )
+    return lines
@@ -0,0 +1,51 @@
+# mongo_indexes.py
+# Declared indexes for both bots + helpers to create them and report drift/usage
+
+from typing import Dict, List, Tuple, Any
+from pymongo import IndexModel
+
+# (keys, options) pairs. _id is always indexed by MongoDB and is not listed.
+IndexSpec = Tuple[List[Tuple[str, int]], Dict[str, Any]]
+
+# Pella catalog collection (MONGO_COLLECTION, "movies" by default)
+# tmdbId is unique: build_catalog_ops upserts by {"tmdbId": ...}, and without the constraint two
+# concurrent first posts for one movie both insert. Entries without a TMDB match have no tmdbId.
+CATALOG_INDEXES: List[IndexSpec] = [
+    ([("tmdbId", 1)], {"name": "tmdbId_1_unique", "unique": True, "partialFilterExpression": {"tmdbId": {"$type": "number"}}}),
+    ([("title", 1), ("releaseDate", 1)], {"name": "title_1_releaseDate_1"}),
+    ([("category", 1), ("updatedAt", -1)], {"name": "category_1_updatedAt_-1"}),
+]
+
+# old name -> declared index that replaces it; the old one is dropped once the new one exists
+SUPERSEDED_CATALOG_INDEXES: Dict[str, str] = {"tmdbId_1": "tmdbId_1_unique"}
+
+# Stream bot (DATABASE_URL / StreamLinksDB). links, channels, settings and
+# movie_screenshots are only ever read by _id today; stored_files is keyed by
+# file_unique_id and looked up by message_id when a storage message has gone.
+# short_links memo rows carry their own expiresAt, the TTL index deletes them then.
+STREAM_INDEXES: Dict[str, List[IndexSpec]] = {
+    "stored_files": [([("message_id", 1)], {"name": "message_id_1"})],
+    "short_links": [([("expiresAt", 1)], {"name": "expiresAt_1_ttl", "expireAfterSeconds": 0})],
+}
+
+
+def index_models(declared) -> List[IndexModel]:
+    return [IndexModel(keys, **opts) for keys, opts in declared]
+
+
+def index_report(collection_name: str, declared, existing_names: List[str], stats: List[Dict[str, Any]]) -> List[str]:
+    """
+    Human readable drift/usage lines for one collection.
+    `stats` is the output of {$indexStats: {}}; it may be empty if the user lacks the privilege.
+    """
+    declared_names = {opts["name"] for _, opts in declared}
+    lines = []
+    for name in sorted(declared_names - set(existing_names)):
+        lines.append(f"{collection_name}: missing index {name}")
+    for name in sorted(set(existing_names) - declared_names - {"_id_"}):
+        lines.append(f"{collection_name}: undeclared index {name}")
+    for s in stats:
+        name = s.get("name")
+        if name != "_id_" and int(s.get("accesses", {}).get("ops", 0)) == 0:
+            lines.append(f"{collection_name}: unused index {name} (since {s.get('accesses', {}).get('since')})")
+    return lines
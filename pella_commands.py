@@ -5,7 +5,12 @@ from telegram import Update
 from telegram.ext import ContextTypes, CommandHandler
 from pymongo import MongoClient
 import os
+import re
+import asyncio
+import logging
 import unicodedata
+from abc import ABC, abstractmethod
+from typing import List, Optional
 
 # --- DATABASE CONNECTION ---
 MONGODB_URI = os.getenv("MONGODB_URI")
@@ -18,6 +23,8 @@ client = MongoClient(MONGODB_URI)
 db = client[DB]
 ban_collection = db["banlist"]   # Collection to store banned words/phrases
 
+logger = logging.getLogger("smart-bot")
+
 # --- HELPER: NORMALIZE TEXT ---
 def normalize_text(text: str) -> str:
     """
@@ -29,6 +36,98 @@ def normalize_text(text: str) -> str:
     normalized = unicodedata.normalize('NFKD', text)
     return normalized.lower().strip()
 
+# --- CONFIG CACHES (auth_config / ban_config held in memory) ---
+# Writers bump a "version" field; other instances reconcile every CONFIG_REFRESH_SECONDS
+CONFIG_REFRESH_SECONDS = int(os.getenv("CONFIG_REFRESH_SECONDS", "60"))
+
+class CachedConfigDoc(ABC):
+    """In-memory copy of one banlist document, reloaded only when its version changes."""
+    doc_id = ""
+
+    def __init__(self):
+        self.version: Optional[int] = None
+        self.loaded = False
+
+    @abstractmethod
+    def apply(self, doc: dict):
+        """Rebuilds the in-memory state from the full document."""
+
+    def load(self):
+        doc = ban_collection.find_one({"_id": self.doc_id}) or {}
+        self.apply(doc)
+        self.version = doc.get("version", 0)
+        self.loaded = True
+
+    def ensure_loaded(self):
+        if not self.loaded: self.load()
+
+    def refresh(self):
+        """Cheap version probe; full reload only if another instance changed the document."""
+        if not self.loaded:
+            self.load()
+            return
+        doc = ban_collection.find_one({"_id": self.doc_id}, {"version": 1}) or {}
+        if doc.get("version", 0) != self.version:
+            self.load()
+
+class BanMatcher(CachedConfigDoc):
+    """
+    Holds every banned phrase compiled into a single case-insensitive alternation.
+    Longest phrases come first so overlapping items behave like the old sequential passes.
+    """
+    doc_id = "ban_config"
+
+    def __init__(self):
+        super().__init__()
+        self.items: List[str] = []
+        self.pattern: Optional[re.Pattern] = None
+
+    def apply(self, doc: dict):
+        self.items = [i for i in doc.get("items", []) if i]
+        ordered = sorted(self.items, key=len, reverse=True)
+        self.pattern = re.compile("|".join(re.escape(i) for i in ordered), flags=re.IGNORECASE) if ordered else None
+
+    def remove(self, text: str) -> str:
+        self.ensure_loaded()
+        if not text or self.pattern is None: return text
+        return self.pattern.sub("", text)
+
+class AuthCache(CachedConfigDoc):
+    """Allowed user ids from auth_config."""
+    doc_id = "auth_config"
+
+    def __init__(self):
+        super().__init__()
+        self.allowed_ids: List[int] = []
+        self._allowed_set = frozenset()
+
+    def apply(self, doc: dict):
+        self.allowed_ids = list(doc.get("allowed_ids", []))
+        self._allowed_set = frozenset(self.allowed_ids)
+
+    def is_allowed(self, user_id: int) -> bool:
+        self.ensure_loaded()
+        return user_id in self._allowed_set
+
+ban_matcher = BanMatcher()
+auth_cache = AuthCache()
+CONFIG_CACHES = (ban_matcher, auth_cache)
+
+def warm_caches():
+    """Startup load of every config cache."""
+    for cache in CONFIG_CACHES:
+        cache.load()
+
+async def reconcile_caches():
+    """Background loop picking up changes made by other instances."""
+    while True:
+        await asyncio.sleep(CONFIG_REFRESH_SECONDS)
+        for cache in CONFIG_CACHES:
+            try:
+                await asyncio.to_thread(cache.refresh)
+            except Exception as e:
+                logger.warning(f"Config cache refresh failed ({cache.doc_id}): {e}")
+
 # --- HELPER: CHECK AUTHORIZATION ---
 def is_user_allowed(user_id: int) -> bool:
     """
@@ -36,12 +135,7 @@ def is_user_allowed(user_id: int) -> bool:
     """
     if user_id == OWNER_ID:
         return True
-    
-    doc = ban_collection.find_one({"_id": "auth_config"})
-    if doc and "allowed_ids" in doc and user_id in doc["allowed_ids"]:
-        return True
-    
-    return False
+    return auth_cache.is_allowed(user_id)
 
 # --- COMMAND HANDLERS ---
 
@@ -90,12 +184,12 @@ async def ban_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     # --- LIST WORDS ---
     if full_input.lower() == "list":
-        doc = ban_collection.find_one({"_id": "ban_config"})
-        if not doc or "items" not in doc or not doc["items"]:
+        ban_matcher.ensure_loaded()
+        items = ban_matcher.items
+        if not items:
             await msg.reply_text("📂 Ban list is empty.")
             return
 
-        items = doc["items"]
         # HTML safe formatting for list
         preview = "\n".join([f"• {item}" for item in items])
         await msg.reply_text(f"🚫 <b>Current Banned Items ({len(items)}):</b>\n\n{preview}", parse_mode="HTML")
@@ -104,11 +198,13 @@ async def ban_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     # --- BAN WORD ---
     normalized_input = normalize_text(full_input)
 
-    ban_collection.update_one(
+    await asyncio.to_thread(
+        ban_collection.update_one,
         {"_id": "ban_config"},
-        {"$addToSet": {"items": normalized_input}},
+        {"$addToSet": {"items": normalized_input}, "$inc": {"version": 1}},
         upsert=True
     )
+    await asyncio.to_thread(ban_matcher.load)
 
     await msg.reply_text(
         f"🚫 <b>Banned Successfully!</b>\n\n"
@@ -132,11 +228,12 @@ async def unban_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     phrase_to_remove = " ".join(ctx.args)
     normalized_phrase = normalize_text(phrase_to_remove)
 
-    result = ban_collection.update_one(
-        {"_id": "ban_config"},
-        {"$pull": {"items": normalized_phrase}},
-        upsert=True
+    result = await asyncio.to_thread(
+        ban_collection.update_one,
+        {"_id": "ban_config", "items": normalized_phrase},
+        {"$pull": {"items": normalized_phrase}, "$inc": {"version": 1}}
     )
+    await asyncio.to_thread(ban_matcher.load)
 
     if result.modified_count > 0:
         await msg.reply_text(f"✅ Unbanned: <code>{phrase_to_remove}</code>", parse_mode="HTML")
@@ -156,11 +253,13 @@ async def allow_user_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     try:
         new_user_id = int(ctx.args[0])
-        ban_collection.update_one(
+        await asyncio.to_thread(
+            ban_collection.update_one,
             {"_id": "auth_config"},
-            {"$addToSet": {"allowed_ids": new_user_id}},
+            {"$addToSet": {"allowed_ids": new_user_id}, "$inc": {"version": 1}},
             upsert=True
         )
+        await asyncio.to_thread(auth_cache.load)
         await update.message.reply_text(f"✅ User <code>{new_user_id}</code> allowed.", parse_mode="HTML")
     except ValueError:
         await update.message.reply_text("❌ Invalid ID.")
@@ -176,11 +275,13 @@ async def remove_user_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     try:
         target_id = int(ctx.args[0])
-        ban_collection.update_one(
+        await asyncio.to_thread(
+            ban_collection.update_one,
             {"_id": "auth_config"},
-            {"$pull": {"allowed_ids": target_id}},
+            {"$pull": {"allowed_ids": target_id}, "$inc": {"version": 1}},
             upsert=True
         )
+        await asyncio.to_thread(auth_cache.load)
         await update.message.reply_text(f"🚫 User <code>{target_id}</code> removed.", parse_mode="HTML")
     except ValueError:
         await update.message.reply_text("❌ Invalid ID.")
@@ -189,12 +290,12 @@ async def user_list_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != OWNER_ID:
         return
 
-    doc = ban_collection.find_one({"_id": "auth_config"})
-    if not doc or "allowed_ids" not in doc or not doc["allowed_ids"]:
+    auth_cache.ensure_loaded()
+    if not auth_cache.allowed_ids:
         await update.message.reply_text("📂 No additional users allowed.")
         return
 
-    ids = "\n".join([f"<code>{uid}</code>" for uid in doc["allowed_ids"]])
+    ids = "\n".join([f"<code>{uid}</code>" for uid in auth_cache.allowed_ids])
     await update.message.reply_text(f"👥 <b>Allowed Users:</b>\n\n{ids}", parse_mode="HTML")
 
 # --- EXPORT HANDLERS ---
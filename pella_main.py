@@ -2,20 +2,32 @@
 # Updated for 7 Screenshots and Automated Metadata Support
 
 import os
+import asyncio
 import re
 import logging
 import math
 import unicodedata
-import subprocess # --- NAYA: FFmpeg chalane ke liye ---
-from datetime import datetime
+import hashlib
+import tempfile
+from datetime import datetime, timezone
+from collections import OrderedDict
 from typing import Tuple, Optional, List, Dict, Any
-import requests
-from pymongo import MongoClient, ReturnDocument
+import httpx
+from pymongo import MongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from telegram import Update, Message
 from telegram.ext import ApplicationBuilder, ContextTypes, MessageHandler, filters
 from dotenv import load_dotenv
 from bson import ObjectId
-from pella_commands import get_handlers
+from pella_commands import get_handlers, ban_matcher, warm_caches, reconcile_caches
+from pella_tmdb import TMDBClient
+from media_probe import run_ffmpeg, cached_probe, quality_from_resolution
+from caption_parser import parse_caption, parse_media
+from database import db as stream_db
+import screenshot_service
+from pella_title_index import title_index, title_similarity, TITLE_FUZZY_CUTOFF
+from mongo_indexes import CATALOG_INDEXES, SUPERSEDED_CATALOG_INDEXES, index_models, index_report
+from metrics import span, trace
 
 # Load env
 load_dotenv()
@@ -26,10 +38,17 @@ TMDB_API_KEY = os.getenv("TMDB_API_KEY")
 MONGODB_URI = os.getenv("MONGODB_URI")
 DB = os.getenv("MONGO_DB_NAME", "moviesdb")
 COL = os.getenv("MONGO_COLLECTION", "movies")
+# Webhook mode: updates arrive through the stream server's FastAPI app instead of long polling
+PELLA_WEBHOOK_URL = os.getenv("PELLA_WEBHOOK_URL", "").rstrip("/")
+PELLA_WEBHOOK_PATH = "/pella/webhook"
+PELLA_UPDATE_QUEUE_SIZE = int(os.getenv("PELLA_UPDATE_QUEUE_SIZE", "1000"))
 
 if not BOT_TOKEN or not TMDB_API_KEY or not MONGODB_URI:
     raise SystemExit("Set PELLA_BOT_TOKEN, TMDB_API_KEY, MONGODB_URI in env")
 
+# Telegram echoes this in X-Telegram-Bot-Api-Secret-Token; derived from the token if not set
+PELLA_WEBHOOK_SECRET = os.getenv("PELLA_WEBHOOK_SECRET") or hashlib.sha256(f"pella-webhook:{BOT_TOKEN}".encode()).hexdigest()
+
 # --- logging ---
 logging.basicConfig(format="%(asctime)s - %(levelname)s - %(message)s", level=logging.INFO)
 logger = logging.getLogger("smart-bot")
@@ -40,6 +59,39 @@ db = client[DB]
 collection = db[COL]
 ban_collection = db["banlist"]
 
+def ensure_catalog_indexes():
+    """Creates the catalog indexes the lookups rely on and logs drift/unused indexes."""
+    try:
+        # One at a time: the unique tmdbId index fails on catalogs that already hold duplicates,
+        # which must not keep the other indexes from being built
+        for model in index_models(CATALOG_INDEXES):
+            try: collection.create_indexes([model])
+            except Exception as e: logger.error(f"Index {model.document['name']} not created on {COL}: {e}")
+        existing = list(collection.index_information().keys())
+        for old, new in SUPERSEDED_CATALOG_INDEXES.items():
+            if old in existing and new in existing:
+                collection.drop_index(old)
+                existing.remove(old)
+        try: stats = list(collection.aggregate([{"$indexStats": {}}]))
+        except Exception: stats = []
+        for line in index_report(COL, CATALOG_INDEXES, existing, stats): logger.warning(f"Index: {line}")
+    except Exception as e:
+        logger.error(f"Index setup failed for {COL}: {e}")
+
+def write_catalog_ops(ops: List[UpdateOne]):
+    """
+    bulk_write for build_catalog_ops output. Two first posts for one movie can race on the
+    tmdbId upsert; the loser hits the unique index and is retried once, now as an update.
+    Every op is conditional, so re-running the ops that already applied is harmless.
+    """
+    try:
+        return collection.bulk_write(ops, ordered=True)
+    except (BulkWriteError, DuplicateKeyError) as e:
+        errors = e.details.get("writeErrors", []) if isinstance(e, BulkWriteError) else [{"code": e.code}]
+        if not errors or any(err.get("code") != 11000 for err in errors): raise
+        logger.info(f"Catalog upsert raced on a duplicate key, retrying {len(ops)} ops")
+        return collection.bulk_write(ops, ordered=True)
+
 # --- HELPER: File Size Formatter ---
 def format_size(size_bytes: int) -> str:
     """Converts bytes into a human-readable format like MB/GB."""
@@ -89,19 +141,8 @@ def clean_title_remove_resolution(title: str) -> str:
     return cleaned
 
 # -----------------------------
-# Caption / quality helpers
+# Caption / quality helpers (thin wrappers over caption_parser)
 # -----------------------------
-QUALITY_TOKENS = [
-    r"1080p", r"720p", r"480p", r"2160p", r"4k",
-    r"bluray", r"blu[\-\s]?ray", r"hdrip", r"webrip", r"web[\-\s]?dl",
-    r"x264", r"x265", r"hevc", r"10bit",
-    r"uncut", r"esubs?", r"e\-?sub",
-    r"dual[\-\s]?audio", r"dubbed", r"hindi", r"english", r"malayalam",
-    r"tamil", r"telugu", r"kannada", r"hdtv", r"rip",
-    r"amzn", r"ddp5\.1", r"aac5\.1"
-]
-QUALITY_REGEX = re.compile(r"\b(" + r"|".join(QUALITY_TOKENS) + r")\b", flags=re.IGNORECASE)
-
 def remove_non_printable(s: str) -> str:
     """Filters out non-ASCII characters from the text."""
     return re.sub(r"[^\x00-\x7F]+", " ", s or "")
@@ -110,73 +151,29 @@ def normalize_spaces(s: str) -> str:
     """Reduces multiple spaces into a single space."""
     return re.sub(r"\s+", " ", (s or "")).strip()
 
-def clean_token_regex() -> str:
-    """Returns the combined regex string for quality tokens."""
-    return r"|".join(QUALITY_TOKENS)
-
 def extract_name_and_year_from_caption(caption: str) -> Tuple[str, Optional[str]]:
     """Separates movie name and release year from the caption."""
     if not caption: return "", None
-    text = remove_non_printable(caption).strip()
-    text = normalize_spaces(text)
-    
-    # Looking for a 4-digit year starting with 19 or 20
-    m = re.search(r"\b(19|20)\d{2}\b", text)
-    if not m:
-        # If no year found, strip brackets and common symbols
-        cleaned = re.sub(r"\[.*?\]|\(.*?\)|\{.*?\}", " ", text)
-        cleaned = re.sub(r"[^\w\s\-\.\:]", " ", cleaned)
-        return normalize_spaces(cleaned), None
-        
-    year = m.group(0)
-    idx = m.start()
-    before = text[:idx].strip()
-    
-    # Remove technical quality tags from the title portion
-    patt = re.compile(r"\b(" + clean_token_regex() + r")\b", flags=re.IGNORECASE)
-    before = patt.sub(" ", before)
-    before = re.sub(r"[^\w\s\-\.\:]", " ", before)
-    before = normalize_spaces(before)
-    
-    # Proper capitalization for the title
-    before_title = " ".join([w.capitalize() for w in before.split()]) if before else ""
-    return before_title, year
+    parsed = parse_caption(caption)
+    return parsed["name"], parsed["year"]
 
 def extract_quality_from_caption(caption: str) -> str:
     """Extracts resolution/quality keyword from the caption text."""
     if not caption: return ""
-    c = remove_non_printable(caption).lower()
-    
-    # Priority matching for standard resolutions
-    for q in ["2160p", "4k", "1080p", "720p", "480p"]:
-        if q in c: return q
-        
-    m = QUALITY_REGEX.search(c)
-    return m.group(0).strip() if m else ""
+    return parse_caption(caption)["quality"]
 # main.py - Part 3/5
 
 # ---------------------------------------------------
 # DYNAMIC CLEANER
 # ---------------------------------------------------
-def get_banned_items_from_db() -> List[str]:
-    """Fetches the list of banned words from the MongoDB banlist collection."""
-    try:
-        doc = ban_collection.find_one({"_id": "ban_config"})
-        return doc["items"] if doc and "items" in doc else []
-    except Exception as e:
-        logger.error(f"Error fetching ban list: {e}")
-        return []
-
 def clean_caption_remove_links(text: str) -> str:
     """Removes banned phrases and cleans up the caption for TMDB searching."""
     if not text: return ""
     text = unicodedata.normalize('NFKD', text)
-    banned_items = get_banned_items_from_db()
-    banned_items.sort(key=len, reverse=True)
-    for item in banned_items:
-        if not item: continue
-        pattern = re.compile(re.escape(item), flags=re.IGNORECASE)
-        text = pattern.sub("", text)
+    try:
+        text = ban_matcher.remove(text)
+    except Exception as e:
+        logger.error(f"Error applying ban list: {e}")
     lines = text.split("\n")
     out = [line.strip() for line in lines if line.strip()]
     return "\n".join(out).strip()
@@ -192,8 +189,7 @@ def get_quality_score(q_str: str) -> int:
     return 0
 
 # --- TMDB HELPERS (Director, Producer, Trailer Fix) ---
-TMDB_SEARCH_URL = "https://api.themoviedb.org/3/search/movie"
-TMDB_MOVIE_URL = "https://api.themoviedb.org/3/movie/{movie_id}"
+tmdb_client = TMDBClient(TMDB_API_KEY)
 
 def extract_director_producer(tmdb_detail: Dict[str, Any]) -> Tuple[str, str]:
     """Extracts Director and Producer names from TMDB credits crew list."""
@@ -211,68 +207,101 @@ def extract_trailer_link(tmdb_detail: Dict[str, Any]) -> str:
     return ""
 
 # --- NAYA: TELEGRAPH UPLOAD ---
-def upload_to_telegraph(path: str) -> Optional[str]:
+TELEGRAPH_UPLOAD_URL = "https://telegra.ph/upload"
+TELEGRAPH_RETRIES = 3
+SCREENSHOT_COUNT = 7
+CAPTURE_WORKERS = int(os.getenv("CAPTURE_WORKERS", "3"))
+CAPTURE_TIMEOUT = 60
+FALLBACK_TIMESTAMPS = [300, 900, 1800, 2700, 3600, 4500, 5400]  # old fixed 5:00…1:30:00 points
+telegraph_client: Optional[httpx.AsyncClient] = None
+
+def get_telegraph_client() -> httpx.AsyncClient:
+    global telegraph_client
+    if telegraph_client is None or telegraph_client.is_closed:
+        telegraph_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(30, connect=10),
+            limits=httpx.Limits(max_connections=CAPTURE_WORKERS, max_keepalive_connections=CAPTURE_WORKERS),
+        )
+    return telegraph_client
+
+async def upload_to_telegraph(path: str) -> Optional[str]:
     """Photo ko Telegraph par upload karke uska link deta hai."""
-    try:
-        with open(path, 'rb') as f:
-            response = requests.post(
-                'https://telegra.ph/upload',
-                files={'file': ('file', f, 'image/jpg')}
-            ).json()
+    with open(path, 'rb') as f:
+        data = f.read()
+    for attempt in range(1, TELEGRAPH_RETRIES + 1):
+        try:
+            with span("telegraph_upload"):
+                r = await get_telegraph_client().post(TELEGRAPH_UPLOAD_URL, files={'file': ('file.jpg', data, 'image/jpg')})
+            response = r.json()
             if isinstance(response, list) and len(response) > 0:
                 return "https://telegra.ph" + response[0]['src']
-    except Exception as e:
-        logger.error(f"Telegraph Upload Error: {e}")
+            logger.error(f"Telegraph Upload Error: {response}")
+        except Exception as e:
+            logger.error(f"Telegraph Upload Error (attempt {attempt}/{TELEGRAPH_RETRIES}): {e}")
+        if attempt < TELEGRAPH_RETRIES:
+            await asyncio.sleep(attempt)
     return None
 
-# --- NAYA: 7 SCREENSHOTS CAPTURE ---
-def capture_screenshots(video_url: str, movie_id: str) -> List[str]:
-    """Video URL se 7 alag-alag jagah se screenshots nikalta hai."""
-    screenshot_links = []
-    timestamps = [
-        "00:05:00", "00:15:00", "00:30:00", 
-        "00:45:00", "01:00:00", "01:15:00", "01:30:00"
-    ]
-    for i, ts in enumerate(timestamps):
-        output_file = f"ss_{movie_id}_{i}.jpg"
-        cmd = [
-            'ffmpeg', '-ss', ts, '-i', video_url, 
-            '-frames:v', '1', '-q:v', '2', output_file, '-y'
-        ]
-        try:
-            subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
-            link = upload_to_telegraph(output_file)
-            if link: screenshot_links.append(link)
-            if os.path.exists(output_file): os.remove(output_file)
-        except Exception as e:
-            logger.error(f"Screenshot failed at {ts}: {e}")
-    return screenshot_links
+async def probe_duration(video_url: str, file_unique_id: Optional[str] = None) -> float:
+    """
+    Reads the container header once; ffmpeg only fetches what it needs over HTTP ranges.
+    A file the stream bot already probed is answered from its media_probes cache.
+    """
+    info = await cached_probe(video_url, file_unique_id)
+    return info["duration"] if info else 0.0
+
+def plan_timestamps(duration: float, count: int = SCREENSHOT_COUNT) -> List[float]:
+    """Evenly spread between 10% and 90% of the runtime, so short files get valid seeks too."""
+    if duration <= 0: return FALLBACK_TIMESTAMPS[:count]
+    start, end = duration * 0.10, duration * 0.90
+    step = (end - start) / count
+    return [start + i * step for i in range(count)]
 
-def tmdb_search(query: str, year: Optional[str] = None, max_results: int = 10) -> List[Dict[str, Any]]:
+# --- NAYA: 7 SCREENSHOTS CAPTURE ---
+async def capture_screenshots(video_url: str, movie_id: str, file_unique_id: Optional[str] = None) -> List[str]:
+    """Video URL se 7 alag-alag jagah se screenshots nikalta hai (parallel capture, upload as each frame lands)."""
+    with span("probe"):
+        timestamps = plan_timestamps(await probe_duration(video_url, file_unique_id))
+    semaphore = asyncio.Semaphore(CAPTURE_WORKERS)
+
+    async def capture_and_upload(i: int, ts: float, tmpdir: str) -> Optional[str]:
+        output_file = os.path.join(tmpdir, f"ss_{movie_id}_{i}.jpg")
+        async with semaphore:
+            with span("ffmpeg_frame"):
+                code, err = await run_ffmpeg(['-loglevel', 'error', '-ss', f"{ts:.3f}", '-i', video_url,
+                                              '-frames:v', '1', '-q:v', '2', '-y', output_file], CAPTURE_TIMEOUT)
+        if code != 0 or not os.path.exists(output_file) or os.path.getsize(output_file) == 0:
+            logger.error(f"Screenshot failed at {ts:.0f}s: {err.strip()[:200]}")
+            return None
+        return await upload_to_telegraph(output_file)
+
+    with tempfile.TemporaryDirectory(prefix="pella_ss_") as tmpdir:
+        links = await asyncio.gather(*(capture_and_upload(i, ts, tmpdir) for i, ts in enumerate(timestamps)))
+    return [link for link in links if link]
+
+async def tmdb_search(query: str, year: Optional[str] = None, max_results: int = 10) -> List[Dict[str, Any]]:
     """Searches for movies on TMDB based on the extracted name and year."""
     if not query: return []
-    params = {"api_key": TMDB_API_KEY, "query": query, "include_adult": False}
-    if year: params["year"] = year
     try:
-        r = requests.get(TMDB_SEARCH_URL, params=params, timeout=10)
-        r.raise_for_status()
-        return r.json().get("results", [])[:max_results]
+        with span("tmdb_search"):
+            return await tmdb_client.search(query, year, max_results)
     except Exception as e:
         logger.exception("TMDB search failed: %s", e)
         return []
 
-def tmdb_get_details(movie_id: int) -> Optional[Dict[str, Any]]:
+async def tmdb_get_details(movie_id: int) -> Optional[Dict[str, Any]]:
     """Fetches detailed metadata, including credits and videos, for a specific TMDB ID."""
     try:
-        url = TMDB_MOVIE_URL.format(movie_id=movie_id)
-        params = {"api_key": TMDB_API_KEY, "append_to_response": "videos,credits"}
-        r = requests.get(url, params=params, timeout=10)
-        r.raise_for_status()
-        return r.json()
+        with span("tmdb_details"):
+            return await tmdb_client.get_details(movie_id)
     except Exception as e:
         logger.exception("TMDB details failed: %s", e)
         return None
 
+async def tmdb_resolve(candidates: List[Tuple[str, Optional[str]]]) -> Optional[Dict[str, Any]]:
+    """Runs all candidate searches concurrently and fetches details for the first usable match."""
+    return await tmdb_client.resolve(candidates, tmdb_search, choose_best_tmdb_result, tmdb_get_details)
+
 def build_image_url(path: Optional[str]) -> str:
     """Constructs the full TMDB image URL for posters and backdrops."""
     return f"https://image.tmdb.org/t/p/original{path}" if path else ""
@@ -281,44 +310,7 @@ def build_image_url(path: Optional[str]) -> str:
 # --- SERIES ANALYZER (S1/E1 & Pack Detection) ---
 def analyze_series_info(caption: str) -> Dict[str, Any]:
     """Analyzes the caption to detect if it's a series, a single episode, or a season pack."""
-    cap = caption.lower()
-    result = {"is_series": False, "season": 1, "type": "episode", "ep_num": 1, "title": ""}
-
-    # 1. Check Range/Pack: S01 E01-10
-    range_match = re.search(r"(?:s|season)\s?(\d+).*?(?:e|ep|episode)\s?(\d+)\s?-\s?(\d+)", cap)
-    if range_match:
-        result.update({
-            "is_series": True,
-            "season": int(range_match.group(1)),
-            "type": "pack",
-            "title": f"Episodes {range_match.group(2)}-{range_match.group(3)}"
-        })
-        return result
-
-    # 2. Check Single Episode: S01 E01
-    single_match = re.search(r"(?:s|season)\s?(\d+)\s?(?:e|ep|episode)\s?(\d+)", cap)
-    if single_match:
-        result.update({
-            "is_series": True,
-            "season": int(single_match.group(1)),
-            "type": "episode",
-            "ep_num": int(single_match.group(2)),
-            "title": f"Episode {single_match.group(2)}"
-        })
-        return result
-
-    # 3. Check Season Pack (Full Season)
-    season_match = re.search(r"(?:s|season)\s?(\d+)", cap)
-    if season_match:
-        result.update({
-            "is_series": True,
-            "season": int(season_match.group(1)),
-            "type": "pack",
-            "title": f"Season {season_match.group(1)} (Full)"
-        })
-        return result
-
-    return result
+    return parse_caption(caption)["series"]
 
 def detect_category(tmdb_detail: Dict[str, Any], caption: str, series_info: Dict) -> str:
     """Determines the movie/series category based on language and series detection."""
@@ -333,20 +325,20 @@ def detect_category(tmdb_detail: Dict[str, Any], caption: str, series_info: Dict
 def choose_best_tmdb_result(results, search_name, search_year):
     """Selects the most relevant TMDB result based on name and year matching."""
     if not results: return None
+    def score(r):
+        s = title_similarity(r.get("title", ""), search_name)
+        return s if s >= TITLE_FUZZY_CUTOFF else 0.0
     if search_year:
         matches = [r for r in results if r.get("release_date", "").startswith(search_year)]
         if matches:
-            for r in matches:
-                if r.get("title", "").strip().lower() == search_name.strip().lower(): return r
-            return sorted(matches, key=lambda x: x.get("popularity", 0), reverse=True)[0]
-    for r in results:
-        if r.get("title", "").strip().lower() == search_name.strip().lower(): return r
-    return results[0]
-
-def build_mongo_document(tmdb_detail, full_caption_title, message_id_str, quality_str):
+            return max(matches, key=lambda x: (score(x), x.get("popularity", 0)))
+    best = max(results, key=score)
+    return best if score(best) > 0 else results[0]
+
+def build_mongo_document(tmdb_detail, full_caption_title, message_id_str, quality_str, series_info=None):
     """Creates a new MongoDB document structure matching the ZackHub schema."""
     now_iso = datetime.utcnow().isoformat() + "Z"
-    series_info = analyze_series_info(full_caption_title)
+    if series_info is None: series_info = analyze_series_info(full_caption_title)
     final_cat = detect_category(tmdb_detail or {}, full_caption_title, series_info)
 
     # Metadata helpers (Director, Producer, Trailer)
@@ -393,130 +385,324 @@ def build_lookup_key(full_caption_title: str, tmdb_release_date: str) -> Dict[st
         return {"title": cleaned_title, "releaseDate": tmdb_release_date}
     return {"title": cleaned_title}
 
-async def handle(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
-    try:
-        msg = update.channel_post or update.edited_channel_post
-        if not msg or not (msg.video or msg.document): return
-
-        message_id_str = str(msg.message_id)
-        caption = msg.caption or ""
-        
-        file_obj = msg.video or msg.document
-        f_size_bytes = file_obj.file_size if file_obj else 0
-        readable_size = format_size(f_size_bytes) if f_size_bytes > 0 else ""
-        
-        dl_urls = extract_urls(msg) 
-        
+# --- CATALOG WRITE PATH (atomic partial updates) ---
+CATALOG_PROJECTION = {"_id": 1, "category": 1, "screenshots": 1}
+
+def find_catalog_entry(new_doc: Dict[str, Any], year: Optional[str]) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """
+    Returns (filter, existing) for the catalog entry this post belongs to.
+    Only the fields the write path needs are read back, never the whole document.
+    """
+    tmdb_id = new_doc.get("tmdbId")
+    if tmdb_id:
+        existing = collection.find_one({"tmdbId": tmdb_id}, CATALOG_PROJECTION)
+        if existing: return {"tmdbId": tmdb_id}, existing
+    existing = collection.find_one(build_lookup_key(new_doc["title"], year or new_doc["releaseDate"]), CATALOG_PROJECTION)
+    if existing: return {"_id": existing["_id"]}, existing
+    # New entry: fix its _id up front so the title index can learn it before the write lands
+    new_doc["_id"] = ObjectId()
+    title_index.add(new_doc["title"], new_doc["releaseDate"], tmdb_id, new_doc["_id"])
+    if tmdb_id: return {"tmdbId": tmdb_id}, None
+    return build_lookup_key(new_doc["title"], new_doc["releaseDate"]), None
+
+def find_indexed_entry(name: str, year: Optional[str]) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Resolves a title through the local index; the projected read confirms the entry still exists."""
+    hit = title_index.lookup(name, year)
+    if not hit: return None, None
+    existing = collection.find_one({"_id": hit["_id"]}, CATALOG_PROJECTION)
+    return ({"_id": hit["_id"]}, existing) if existing else (None, None)
+
+def screenshot_update(entry_key: Dict[str, Any], screenshots: List[str]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """(filter, update) that fills screenshots only if the entry has none yet."""
+    return (
+        {**entry_key, "$or": [{"screenshots": {"$exists": False}}, {"screenshots": {"$size": 0}}]},
+        {"$set": {"screenshots": screenshots}},
+    )
+
+def _no_link_clash(item: Dict[str, Any], key: str) -> Dict[str, Any]:
+    """Same rule as the old sync_links: skip if the link or the quality is already present."""
+    return {"$not": {"$elemMatch": {"$or": [{key: item[key]}, {"quality": item["quality"]}]}}}
+
+def build_catalog_ops(entry_key: Dict[str, Any], existing: Optional[Dict[str, Any]], new_doc: Dict[str, Any],
+                      series_info: Dict[str, Any], tg_link_obj: Dict[str, Any], new_dl_links: List[Dict[str, Any]],
+                      screenshots: Optional[List[str]] = None) -> List[UpdateOne]:
+    """
+    Expresses one post as an ordered list of targeted updates.
+    Every op is conditional, so concurrent posts for the same title cannot overwrite each other.
+    """
+    now_iso = datetime.utcnow().isoformat() + "Z"
+    base = {k: v for k, v in new_doc.items() if k not in entry_key and k != "updatedAt"}
+    ops = [UpdateOne(entry_key, {"$setOnInsert": base, "$set": {"updatedAt": now_iso}}, upsert=True)]
+
+    if screenshots:
+        ops.append(UpdateOne(*screenshot_update(entry_key, screenshots)))
+
+    category = (existing or {}).get("category") or new_doc["category"]
+    if category == "webseries" and series_info["is_series"]:
+        sn = series_info["season"]
+        season_filter = {"s.seasonNumber": sn}
+        ops.append(UpdateOne(
+            {**entry_key, "seasons.seasonNumber": {"$ne": sn}},
+            {"$push": {"seasons": {"seasonNumber": sn, "episodes": [], "fullSeasonFiles": []}}}
+        ))
+        if series_info["type"] == "pack":
+            group, match_field, match_value = "fullSeasonFiles", "title", series_info["title"]
+            fresh = {"title": series_info["title"], "telegramLinks": [], "downloadLinks": []}
+        else:
+            group, match_field, match_value = "episodes", "episodeNumber", series_info["ep_num"]
+            fresh = {"episodeNumber": series_info["ep_num"], "title": series_info["title"], "telegramLinks": [], "downloadLinks": []}
+        ops.append(UpdateOne(
+            {**entry_key, "seasons": {"$elemMatch": {"seasonNumber": sn, f"{group}.{match_field}": {"$ne": match_value}}}},
+            {"$push": {f"seasons.$[s].{group}": fresh}},
+            array_filters=[season_filter]
+        ))
+        for field, items, key in (("telegramLinks", [tg_link_obj], "fileId"), ("downloadLinks", new_dl_links, "link")):
+            for item in items:
+                ops.append(UpdateOne(
+                    entry_key,
+                    {"$push": {f"seasons.$[s].{group}.$[g].{field}": item}},
+                    array_filters=[season_filter, {f"g.{match_field}": match_value, f"g.{field}": _no_link_clash(item, key)}]
+                ))
+    else:
+        for field, items, key in (("telegramLinks", [tg_link_obj], "fileId"), ("downloadLinks", new_dl_links, "link")):
+            for item in items:
+                ops.append(UpdateOne({**entry_key, field: _no_link_clash(item, key)}, {"$push": {field: item}}))
+    return ops
+
+async def build_post_ops(caption: str, message_id_str: str, f_size_bytes: int, dl_urls: List[str],
+                         take_screenshots: bool = True, file_name: str = "",
+                         chat_id: Optional[int] = None) -> Tuple[List[UpdateOne], Optional[Dict[str, Any]]]:
+    """
+    Caption parsing and TMDB resolution for one post, as catalog ops.
+    Also returns a screenshot job when the entry still has no screenshots (see attach_screenshots).
+    """
+    readable_size = format_size(f_size_bytes) if f_size_bytes > 0 else ""
+
+    with span("clean_caption"):
         cleaned_caption = clean_caption_remove_links(caption)
         full_caption_title = normalize_spaces(cleaned_caption) or ""
-        smart_name, year = extract_name_and_year_from_caption(cleaned_caption)
-        
-        raw_quality = extract_quality_from_caption(caption)
-        quality_with_size = f"{raw_quality} ({readable_size})" if readable_size else raw_quality
-        
-        logger.info(f"Processing: {full_caption_title} | Screenshots & Metadata...")
+        parsed = parse_caption(cleaned_caption)
+    smart_name, year = parsed["name"], parsed["year"]
+    
+    raw_quality = parsed["quality"]
+    quality_with_size = f"{raw_quality} ({readable_size})" if readable_size else raw_quality
+    
+    logger.info(f"Processing: {full_caption_title} | Screenshots & Metadata...")
 
+    # Known title: the catalog already has the TMDB metadata, so no external call is needed
+    with span("catalog_lookup"):
+        entry_key, existing = await asyncio.to_thread(find_indexed_entry, smart_name, year) if smart_name else (None, None)
+    chosen_tmdb = None
+    if entry_key is None:
         candidates = [(smart_name, year)] if smart_name and year else []
         if smart_name: candidates.append((smart_name, None))
-        chosen_tmdb = None
-        for q_title, q_year in candidates:
-            res = tmdb_search(q_title, q_year)
-            if res:
-                chosen_tmdb = tmdb_get_details(choose_best_tmdb_result(res, q_title, q_year).get("id"))
-                break
-
-        new_doc, series_info = build_mongo_document(chosen_tmdb, clean_title_remove_resolution(full_caption_title), message_id_str, quality_with_size)
-        
-        if not chosen_tmdb: new_doc["releaseDate"] = year or ""
+        with span("tmdb"):
+            chosen_tmdb = await tmdb_resolve(candidates)
+    else:
+        logger.info(f"Title index hit: {smart_name} ({year}) -> {entry_key['_id']}")
 
-        existing = collection.find_one({"tmdbId": new_doc["tmdbId"]}) if new_doc.get("tmdbId") else None
-        if not existing:
-            existing = collection.find_one(build_lookup_key(new_doc["title"], year or new_doc["releaseDate"]))
-
-        final_doc = existing if existing else new_doc
-        final_doc["updatedAt"] = datetime.utcnow().isoformat() + "Z"
-
-        # --- FIX: USE STREAM LINK FOR SCREENSHOTS ---
-        if not final_doc.get("screenshots"):
-            try:
+    new_doc, series_info = build_mongo_document(chosen_tmdb, clean_title_remove_resolution(full_caption_title), message_id_str, quality_with_size, parsed["series"])
+    
+    if not chosen_tmdb: new_doc["releaseDate"] = year or ""
+
+    if entry_key is None:
+        with span("catalog_lookup"):
+            entry_key, existing = await asyncio.to_thread(find_catalog_entry, new_doc, year)
+
+    screenshot_job = None
+    if take_screenshots and not (existing or {}).get("screenshots"):
+        # Same key and caption quality app.py files movie_screenshots under
+        stream_media = parse_media(file_name, caption)
+        screenshot_job = {
+            "entry_key": entry_key,
+            "movie_key": stream_media["movie_key"],
+            "text_quality": stream_media["resolution"],
+            "video_url": dl_urls[0] if dl_urls else None,
+            "message_id": message_id_str,
+            "chat_id": chat_id,
+        }
+
+    tg_link_obj = {"_id": ObjectId(), "quality": quality_with_size, "fileId": message_id_str}
+    new_dl_links = [{"_id": ObjectId(), "link": url, "url": url, "quality": quality_with_size} for url in dl_urls]
+
+    return build_catalog_ops(entry_key, existing, new_doc, series_info, tg_link_obj, new_dl_links), screenshot_job
+
+async def stream_producer_expected(job: Dict[str, Any]) -> bool:
+    """
+    Whether the stream bot will capture a set for this post, mirroring its checks in app.py
+    (ingest_channel_post, store_screenshots): an allowed channel, a video, a file it has not
+    stored for an earlier post, and a quality it can read before probing. Anything else would
+    leave attach_screenshots polling for a set that never comes.
+    """
+    if not (job["chat_id"] and job.get("stream_candidate")):
+        return False
+    if max(job["text_quality"], job.get("media_quality", 0)) <= 0:
+        return False
+    if not await stream_db.is_channel_allowed(job["chat_id"]):
+        return False
+    stored_at = await stream_db.get_stored_file_time(job.get("file_unique_id"))
+    # not stored yet means the stream bot is still copying this very post
+    return stored_at is None or stored_at >= job["posted_at"]
+
+async def attach_screenshots(job: Dict[str, Any]):
+    """
+    Reuses the stream bot's movie_screenshots set for the same title, waiting for it if the
+    stream bot is processing this channel too; captures from the stream link only as a fallback.
+    """
+    try:
+        with trace("pella_screenshots", job["message_id"]):
+            expect_producer = await stream_producer_expected(job)
+            with span("screenshot_wait"):
+                ss_links = await screenshot_service.find_or_wait(job["movie_key"], expect_producer)
+            if ss_links:
+                logger.info(f"Reusing {len(ss_links)} shared screenshots for '{job['movie_key']}'")
+            elif job["video_url"]:
                 # Agar caption mein Render ya koi download link hai, toh usey use karein
-                video_url = None
-                if dl_urls:
-                    video_url = dl_urls[0] # Pehla link uthayega
-                    logger.info(f"Using Stream Link for screenshots: {video_url}")
-                
-                if video_url:
-                    ss_links = capture_screenshots(video_url, message_id_str)
-                    if ss_links:
-                        final_doc["screenshots"] = ss_links
-                        logger.info(f"Added {len(ss_links)} screenshots via Stream Link.")
-                else:
-                    logger.warning("No stream link found in caption to take screenshots.")
-                    
-            except Exception as e:
-                logger.error(f"Screenshot Fix Failed: {e}")
-
-        tg_link_obj = {"_id": ObjectId(), "quality": quality_with_size, "fileId": message_id_str}
-        new_dl_links = [{"_id": ObjectId(), "link": url, "url": url, "quality": quality_with_size} for url in dl_urls]
-
-        def sync_links(target_list, new_items, key):
-            for item in new_items:
-                url_exists = any(x.get(key) == item[key] for x in target_list)
-                quality_exists = any(x.get("quality") == item["quality"] for x in target_list)
-                if not url_exists and not quality_exists:
-                    target_list.append(item)
-
-        if final_doc["category"] == "webseries" and series_info["is_series"]:
-            sn = series_info["season"]
-            season = next((s for s in final_doc["seasons"] if s["seasonNumber"] == sn), None)
-            if not season:
-                season = {"seasonNumber": sn, "episodes": [], "fullSeasonFiles": []}
-                final_doc["seasons"].append(season)
-            
-            if series_info["type"] == "pack":
-                pack = next((p for p in season["fullSeasonFiles"] if p["title"] == series_info["title"]), None)
-                if not pack:
-                    pack = {"title": series_info["title"], "telegramLinks": [], "downloadLinks": []}
-                    season["fullSeasonFiles"].append(pack)
-                sync_links(pack["telegramLinks"], [tg_link_obj], "fileId")
-                sync_links(pack["downloadLinks"], new_dl_links, "link")
+                logger.info(f"Using Stream Link for screenshots: {job['video_url']}")
+                with span("capture_screenshots"):
+                    ss_links = await capture_screenshots(job["video_url"], job["message_id"], job.get("file_unique_id"))
             else:
-                ep = next((e for e in season["episodes"] if e["episodeNumber"] == series_info["ep_num"]), None)
-                if not ep:
-                    ep = {"episodeNumber": series_info["ep_num"], "title": series_info["title"], "telegramLinks": [], "downloadLinks": []}
-                    season["episodes"].append(ep)
-                sync_links(ep["telegramLinks"], [tg_link_obj], "fileId")
-                sync_links(ep["downloadLinks"], new_dl_links, "link")
-        else:
-            sync_links(final_doc.setdefault("telegramLinks", []), [tg_link_obj], "fileId")
-            sync_links(final_doc.setdefault("downloadLinks", []), new_dl_links, "link")
+                logger.warning("No stream link found in caption to take screenshots.")
+            if ss_links:
+                with span("mongo_write"):
+                    await asyncio.to_thread(collection.update_one, *screenshot_update(job["entry_key"], ss_links))
+                logger.info(f"Added {len(ss_links)} screenshots to {job['entry_key']}")
+    except Exception as e:
+        logger.error(f"Screenshot Fix Failed: {e}")
+
+# --- EDIT DEBOUNCE (ingestion fingerprint per chat/message) ---
+EDIT_DEBOUNCE_SECONDS = float(os.getenv("EDIT_DEBOUNCE_SECONDS", "5"))
+FINGERPRINT_CACHE_SIZE = int(os.getenv("FINGERPRINT_CACHE_SIZE", "20000"))
+ingest_fingerprints: "OrderedDict[Tuple[int, int], str]" = OrderedDict()
+pending_edits: Dict[Tuple[int, int], asyncio.Task] = {}
+
+def post_fingerprint(msg: Message) -> str:
+    """Hash of everything ingestion actually uses: parsed caption fields, links and the file itself."""
+    parsed = parse_caption(clean_caption_remove_links(msg.caption or ""))
+    file_obj = msg.video or msg.document
+    relevant = (parsed["name"], parsed["year"], parsed["quality"], sorted(parsed["series"].items()),
+                extract_urls(msg), getattr(file_obj, "file_unique_id", None))
+    return hashlib.sha1(repr(relevant).encode()).hexdigest()
+
+def remember_fingerprint(key: Tuple[int, int], fingerprint: str):
+    ingest_fingerprints[key] = fingerprint
+    ingest_fingerprints.move_to_end(key)
+    while len(ingest_fingerprints) > FINGERPRINT_CACHE_SIZE:
+        ingest_fingerprints.popitem(last=False)
+
+async def ingest_message(msg: Message, key: Tuple[int, int], fingerprint: str):
+    try:
+        with trace("pella", msg.message_id):
+            file_obj = msg.video or msg.document
+            f_size_bytes = file_obj.file_size if file_obj else 0
+            ops, screenshot_job = await build_post_ops(
+                msg.caption or "", str(msg.message_id), f_size_bytes, extract_urls(msg),
+                file_name=getattr(file_obj, "file_name", None) or "", chat_id=msg.chat_id,
+            )
+            with span("mongo_write"):
+                result = await asyncio.to_thread(write_catalog_ops, ops)
+        remember_fingerprint(key, fingerprint)
+        if screenshot_job:
+            screenshot_job.update(
+                file_unique_id=getattr(file_obj, "file_unique_id", None),
+                stream_candidate=bool(msg.video) or (getattr(msg.document, "mime_type", None) or "").startswith("video/"),
+                media_quality=quality_from_resolution(getattr(msg.video, "width", 0), getattr(msg.video, "height", 0)),
+                posted_at=msg.date.astimezone(timezone.utc).replace(tzinfo=None),
+            )
+            asyncio.create_task(attach_screenshots(screenshot_job))
+        logger.info(f"Done: {msg.message_id} | Ops: {len(ops)} | Modified: {result.modified_count}")
 
-        if existing:
-            collection.replace_one({"_id": existing["_id"]}, final_doc)
-        else:
-            collection.insert_one(final_doc)
-        logger.info(f"Done: {final_doc.get('title')} | Screenshots: {len(final_doc.get('screenshots', []))}")
+    except Exception as e:
+        logger.exception(f"Handle Error: {e}")
+
+async def _debounced_ingest(msg: Message, key: Tuple[int, int], fingerprint: str):
+    """Waits out a burst of edits; a newer edit cancels this task and schedules its own."""
+    try:
+        await asyncio.sleep(EDIT_DEBOUNCE_SECONDS)
+    except asyncio.CancelledError:
+        return
+    if pending_edits.get(key) is asyncio.current_task():
+        del pending_edits[key]
+    if ingest_fingerprints.get(key) == fingerprint: return
+    await ingest_message(msg, key, fingerprint)
+
+async def handle(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    try:
+        msg = update.channel_post or update.edited_channel_post
+        if not msg or not (msg.video or msg.document): return
+
+        key = (msg.chat_id, msg.message_id)
+        fingerprint = post_fingerprint(msg)
+        if update.edited_channel_post:
+            if ingest_fingerprints.get(key) == fingerprint:
+                logger.info(f"Edit skipped (no relevant change): {msg.message_id}")
+                return
+            previous = pending_edits.pop(key, None)
+            if previous: previous.cancel()
+            pending_edits[key] = asyncio.create_task(_debounced_ingest(msg, key, fingerprint))
+            return
+
+        await ingest_message(msg, key, fingerprint)
 
     except Exception as e:
         logger.exception(f"Handle Error: {e}")
 
-async def main():
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+# Running Application, set by main(); the webhook route feeds its update_queue
+application = None
+reconcile_task: Optional[asyncio.Task] = None
+
+
+def feed_update(data: Dict[str, Any]):
+    """Queues a webhook update; raises asyncio.QueueFull when ingestion is behind."""
+    application.update_queue.put_nowait(Update.de_json(data, application.bot))
+
+
+async def start_webhook(app) -> bool:
+    try:
+        await app.bot.set_webhook(
+            url=PELLA_WEBHOOK_URL + PELLA_WEBHOOK_PATH,
+            secret_token=PELLA_WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES,
+        )
+        logger.info(f"Webhook set: {PELLA_WEBHOOK_URL + PELLA_WEBHOOK_PATH}")
+        return True
+    except Exception as e:
+        logger.error(f"Webhook setup failed, falling back to polling: {e}")
+        return False
+
+
+async def main(webhook: bool = True):
+    """`webhook` needs the stream server's FastAPI app in the same process; polling otherwise."""
+    global application, reconcile_task
+    app = (
+        ApplicationBuilder().token(BOT_TOKEN)
+        .update_queue(asyncio.Queue(maxsize=PELLA_UPDATE_QUEUE_SIZE))
+        .build()
+    )
     app.add_handler(MessageHandler(filters.ChatType.CHANNEL & (filters.VIDEO | filters.Document.ALL), handle))
     app.add_handler(MessageHandler(filters.UpdateType.EDITED_CHANNEL_POST, handle))
     for h in get_handlers(): app.add_handler(h)
+    # Inside the stream server the lifespan has connected it already; standalone and in the
+    # WEB_WORKERS pella process it is needed for the channel allow-list and shared screenshots
+    if stream_db.db is None:
+        await stream_db.connect()
+    await asyncio.to_thread(warm_caches)
+    await asyncio.to_thread(ensure_catalog_indexes)
+    await asyncio.to_thread(title_index.load, collection)
+    reconcile_task = asyncio.create_task(reconcile_caches())
     await app.initialize()
     await app.start()
-    await app.updater.start_polling()
+    if not (webhook and PELLA_WEBHOOK_URL and await start_webhook(app)):
+        await app.updater.start_polling()  # also drops any webhook left from an earlier run
+    application = app
     logger.info("Bot Active: Screenshots & Metadata Enabled!")
     await asyncio.Event().wait()
 
 if __name__ == "__main__":
-    import asyncio
     try:
         loop = asyncio.get_running_loop()
     except RuntimeError:
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
-    loop.create_task(main())
+    loop.create_task(main(webhook=False))
     loop.run_forever()
@@ -0,0 +1,124 @@
+# pella_title_index.py
+# In-memory normalised-title index over the catalog, so known titles skip TMDB
+
+import os
+import re
+import logging
+import threading
+from difflib import SequenceMatcher
+from typing import Optional, Dict, Any, List
+
+from caption_parser import parse_caption, build_movie_key
+
+logger = logging.getLogger("smart-bot")
+
+TITLE_FUZZY_CUTOFF = float(os.getenv("TITLE_FUZZY_CUTOFF", "0.92"))
+
+ROMAN_REGEX = re.compile(r"^(x{0,3})(ix|iv|v?i{0,3})$")
+ROMAN_VALUES = {"i": 1, "v": 5, "x": 10}
+NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10}
+PART_WORDS = {"part", "chapter", "vol", "volume"}
+
+
+def normalize_title(title: str) -> str:
+    """Same normalisation as the shared movie_key, without the year."""
+    return build_movie_key(title, None) if title else ""
+
+
+def title_similarity(a: str, b: str) -> float:
+    """0..1 score between two titles after normalisation; shared with choose_best_tmdb_result."""
+    na, nb = normalize_title(a), normalize_title(b)
+    if not na or not nb: return 0.0
+    if na == nb: return 1.0
+    return SequenceMatcher(None, na, nb).ratio()
+
+
+def _roman_value(token: str) -> int:
+    total = 0
+    for i, c in enumerate(token):
+        value = ROMAN_VALUES[c]
+        total += -value if i + 1 < len(token) and ROMAN_VALUES[token[i + 1]] > value else value
+    return total
+
+
+def sequel_markers(key: str) -> tuple:
+    """
+    Numbers in a normalised title (digits, roman numerals, "part two"), as ints, so that
+    "Part 2", "Part II" and "Part Two" agree and "Part 1" vs "Part 2" never fuzzy-match.
+    A lone "i" only counts after part/chapter/volume (it is usually the pronoun).
+    """
+    markers = []
+    tokens = key.split()
+    for i, token in enumerate(tokens):
+        after_part = i > 0 and tokens[i - 1] in PART_WORDS
+        if token.isdigit():
+            markers.append(int(token))
+        elif ROMAN_REGEX.match(token) and (len(token) > 1 or after_part):
+            markers.append(_roman_value(token))
+        elif after_part and token in NUMBER_WORDS:
+            markers.append(NUMBER_WORDS[token])
+    return tuple(sorted(markers))
+
+
+class TitleIndex:
+    """
+    normalised name -> [{_id, tmdbId, year}], bucketed by first word for fuzzy lookups.
+    Catalog titles are stored as cleaned captions, so they go through the caption parser too.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._buckets: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, title: str, release_date: str, tmdb_id, doc_id):
+        parsed = parse_caption(title or "")
+        key = normalize_title(parsed["name"])
+        if not key: return
+        year = (release_date or "")[:4] or parsed["year"]
+        entry = {"_id": doc_id, "tmdbId": tmdb_id, "year": year}
+        with self._lock:
+            bucket = self._entries.setdefault(key, [])
+            if not any(e["_id"] == doc_id for e in bucket):
+                bucket.append(entry)
+            self._buckets.setdefault(key.split(" ", 1)[0], set()).add(key)
+
+    def load(self, collection):
+        count = 0
+        for doc in collection.find({}, {"title": 1, "releaseDate": 1, "tmdbId": 1}):
+            self.add(doc.get("title", ""), doc.get("releaseDate", ""), doc.get("tmdbId"), doc["_id"])
+            count += 1
+        self.loaded = True
+        logger.info(f"Title index loaded: {count} catalog entries, {len(self)} distinct titles")
+
+    def _pick(self, entries: List[Dict[str, Any]], year: Optional[str]) -> Optional[Dict[str, Any]]:
+        if year:
+            return next((e for e in entries if e["year"] == year), None)
+        # Without a year only an unambiguous title is trusted
+        return entries[0] if len(entries) == 1 else None
+
+    def lookup(self, name: str, year: Optional[str]) -> Optional[Dict[str, Any]]:
+        key = normalize_title(name)
+        if not key: return None
+        entries = self._entries.get(key)
+        if entries:
+            hit = self._pick(entries, year)
+            if hit: return hit
+        # Fuzzy matches need the year as a second signal, and never cross sequel numbers
+        if not year: return None
+        markers = sequel_markers(key)
+        best, best_score = None, TITLE_FUZZY_CUTOFF
+        for candidate in tuple(self._buckets.get(key.split(" ", 1)[0], ())):
+            if candidate == key or sequel_markers(candidate) != markers: continue
+            score = SequenceMatcher(None, key, candidate).ratio()
+            if score >= best_score:
+                hit = self._pick(self._entries[candidate], year)
+                if hit: best, best_score = hit, score
+        return best
+
+
+title_index = TitleIndex()
@@ -0,0 +1,103 @@
+# pella_tmdb.py
+# Async TMDB client: shared keep-alive pool, bounded concurrency, retry + 429 backoff
+
+import os
+import asyncio
+import logging
+from typing import Optional, List, Dict, Any, Tuple, Callable
+
+import httpx
+
+logger = logging.getLogger("smart-bot")
+
+TMDB_API_BASE = os.getenv("TMDB_API_BASE", "https://api.themoviedb.org/3").rstrip("/")
+TMDB_MAX_CONCURRENCY = int(os.getenv("TMDB_MAX_CONCURRENCY", "8"))
+TMDB_MAX_RETRIES = int(os.getenv("TMDB_MAX_RETRIES", "3"))
+TMDB_TIMEOUT = float(os.getenv("TMDB_TIMEOUT", "10"))
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class TMDBClient:
+    """One pooled httpx client for every TMDB call made by the Pella bot."""
+
+    def __init__(self, api_key: str, base_url: str = TMDB_API_BASE,
+                 max_concurrency: int = TMDB_MAX_CONCURRENCY, max_retries: int = TMDB_MAX_RETRIES):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self._max_concurrency = max_concurrency
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Created lazily so the pool and semaphore bind to the running event loop
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(TMDB_TIMEOUT, connect=5),
+                limits=httpx.Limits(max_connections=self._max_concurrency,
+                                    max_keepalive_connections=self._max_concurrency,
+                                    keepalive_expiry=60),
+            )
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _get(self, path: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """GET with retries; honours Retry-After on 429 and backs off exponentially otherwise."""
+        client = self._get_client()
+        params = {"api_key": self.api_key, **params}
+        delay = 0.5
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                async with self._semaphore:
+                    r = await client.get(path, params=params)
+                if r.status_code not in RETRY_STATUS or attempt == self.max_retries:
+                    r.raise_for_status()
+                    return r.json()
+                retry_after = r.headers.get("Retry-After")
+                wait = float(retry_after) if retry_after and retry_after.isdigit() else delay
+                logger.warning(f"TMDB {r.status_code} on {path}, retry {attempt}/{self.max_retries} in {wait}s")
+            except (httpx.TransportError, httpx.TimeoutException) as e:
+                if attempt == self.max_retries:
+                    raise
+                wait = delay
+                logger.warning(f"TMDB network error on {path}: {e}, retry {attempt}/{self.max_retries}")
+            await asyncio.sleep(wait)
+            delay *= 2
+        return {}
+
+    async def search(self, query: str, year: Optional[str] = None, max_results: int = 10) -> List[Dict[str, Any]]:
+        params = {"query": query, "include_adult": "false"}
+        if year: params["year"] = year
+        data = await self._get("/search/movie", params)
+        return data.get("results", [])[:max_results]
+
+    async def get_details(self, movie_id: int) -> Dict[str, Any]:
+        return await self._get(f"/movie/{movie_id}", {"append_to_response": "videos,credits"})
+
+    async def resolve(self, candidates: List[Tuple[str, Optional[str]]],
+                      search: Callable, choose: Callable, details: Callable) -> Optional[Dict[str, Any]]:
+        """
+        Fires every candidate search at once, then walks them in priority order.
+        The first candidate with results wins: the rest are cancelled and the
+        details request goes out immediately.
+        """
+        if not candidates: return None
+        tasks = [asyncio.create_task(search(q_title, q_year)) for q_title, q_year in candidates]
+        try:
+            for (q_title, q_year), task in zip(candidates, tasks):
+                res = await task
+                if res:
+                    best = choose(res, q_title, q_year)
+                    if best and best.get("id"):
+                        return await details(best["id"])
+            return None
+        finally:
+            for task in tasks:
+                if not task.done(): task.cancel()
@@ -0,0 +1,108 @@
+# screenshot_service.py
+# One place both bots go through for per-title screenshot sets (movie_screenshots)
+
+import os
+import asyncio
+from typing import Dict, List, Optional
+
+from database import db
+from cache import TTLCache, MISSING
+
+MIN_SCREENSHOT_COUNT = 6
+SCREENSHOT_WAIT_SECONDS = float(os.getenv("SCREENSHOT_WAIT_SECONDS", "300"))
+SCREENSHOT_POLL_SECONDS = 10
+SCREENSHOT_CACHE_TTL = float(os.getenv("SCREENSHOT_CACHE_TTL", "60"))
+SCREENSHOT_MISS_TTL = 15
+SCREENSHOT_BATCH_LIMIT = 100
+SCREENSHOT_FIELDS = {"movie_key": 1, "best_quality": 1, "screenshot_links": 1, "updatedAt": 1}
+
+# movie_key -> lock serialising generation; movie_key -> event set when a generation run ends
+screenshot_locks: Dict[str, asyncio.Lock] = {}
+inflight: Dict[str, asyncio.Event] = {}
+# movie_key -> API payload (None for titles without a set) for the read endpoints
+screenshot_cache = TTLCache(SCREENSHOT_CACHE_TTL, 8192)
+
+
+def get_lock(movie_key: str) -> asyncio.Lock:
+    return screenshot_locks.setdefault(movie_key, asyncio.Lock())
+
+
+def begin(movie_key: str) -> asyncio.Event:
+    """
+    Marks a generation run as started so other consumers wait instead of capturing. Each run
+    gets its own event; the latest run is the one new waiters follow.
+    """
+    event = asyncio.Event()
+    inflight[movie_key] = event
+    return event
+
+
+def finish(movie_key: str, event: asyncio.Event):
+    event.set()
+    if inflight.get(movie_key) is event:  # a later run may have registered since
+        del inflight[movie_key]
+
+
+async def find(movie_key: str) -> Optional[List[str]]:
+    doc = await db.get_movie_screenshots(movie_key)
+    links = (doc or {}).get("screenshot_links", [])
+    return links if len(links) >= MIN_SCREENSHOT_COUNT else None
+
+
+async def find_or_wait(movie_key: str, expect_producer: bool, timeout: float = SCREENSHOT_WAIT_SECONDS) -> Optional[List[str]]:
+    """
+    Returns an existing screenshot set for the title. If a producer is expected (the stream bot
+    is handling the same post) it waits for the set to show up, in-process via the inflight
+    event or by polling movie_screenshots for other instances, before giving up.
+    """
+    if db.movie_screenshots is None:
+        return None
+    links = await find(movie_key)
+    if links or not expect_producer:
+        return links
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while (remaining := deadline - loop.time()) > 0:
+        event = inflight.get(movie_key)
+        try:
+            if event: await asyncio.wait_for(event.wait(), remaining)
+            else: await asyncio.sleep(min(SCREENSHOT_POLL_SECONDS, remaining))
+        except asyncio.TimeoutError:
+            pass
+        links = await find(movie_key)
+        if links: return links
+        if event and event.is_set() and inflight.get(movie_key) is None:
+            return None  # the producer finished without a usable set and no other run is going
+    return None
+
+
+def public_payload(movie_key: str, doc: Dict) -> Dict:
+    return {
+        "movie_key": doc.get("movie_key", movie_key),
+        "best_quality": doc.get("best_quality", 0),
+        "screenshot_links": doc.get("screenshot_links", []),
+        "updatedAt": doc.get("updatedAt"),
+    }
+
+
+def forget(movie_key: str):
+    screenshot_cache.pop(movie_key)
+
+
+async def lookup_many(movie_keys: List[str]) -> Dict[str, Optional[Dict]]:
+    """API payloads for many titles: cache first, then one $in query for the rest."""
+    result: Dict[str, Optional[Dict]] = {}
+    missing = []
+    for key in dict.fromkeys(k.lower().strip() for k in movie_keys if k and k.strip()):
+        cached = screenshot_cache.get(key)
+        if cached is MISSING: missing.append(key)
+        else: result[key] = cached
+    if missing:
+        docs = {d["_id"]: d for d in await db.get_movie_screenshots_many(missing, SCREENSHOT_FIELDS)}
+        for key in missing:
+            doc = docs.get(key)
+            payload = public_payload(key, doc) if doc else None
+            screenshot_cache.set(key, payload, None if doc else SCREENSHOT_MISS_TTL)
+            result[key] = payload
+    return result
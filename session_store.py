@@ -0,0 +1,97 @@
+# session_store.py
+# Optional persistent pyrogram sessions: bot auth keys (as session strings) and the auth keys of
+# exported DC media sessions survive restarts, so a redeploy does not re-authorise every bot
+# or redo ExportAuthorization/ImportAuthorization per DC.
+#
+# SESSION_STORE="" keeps the old fully in-memory behaviour, "file" writes SESSION_DIR/<name>.json,
+# "mongo" uses the sessions collection through database.py. Stored sessions are credentials.
+
+import os
+import json
+import base64
+import asyncio
+import hashlib
+from typing import Dict, Any, Optional
+
+from pyrogram.errors import Unauthorized
+
+from database import db
+
+SESSION_STORE = os.environ.get("SESSION_STORE", "").strip().lower()
+SESSION_DIR = os.environ.get("SESSION_DIR", "sessions")
+
+
+def enabled() -> bool:
+    return SESSION_STORE in ("file", "mongo")
+
+
+def _token_hash(token: str) -> str:
+    # A different token for the same slot must not pick up the old bot's session
+    return hashlib.sha256((token or "").encode()).hexdigest()[:16]
+
+
+def _path(name: str) -> str:
+    return os.path.join(SESSION_DIR, f"{name}.json")
+
+
+def _read_file(name: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(_path(name)) as f: return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_file(name: str, doc: Dict[str, Any]):
+    os.makedirs(SESSION_DIR, exist_ok=True)
+    tmp = _path(name) + ".tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f: json.dump(doc, f)
+    os.replace(tmp, _path(name))
+
+
+async def _load(name: str) -> Optional[Dict[str, Any]]:
+    if SESSION_STORE == "file": return await asyncio.to_thread(_read_file, name)
+    if SESSION_STORE == "mongo": return await db.get_session(name)
+    return None
+
+
+async def _update(name: str, fields: Dict[str, Any], replace: bool = False):
+    if SESSION_STORE == "file":
+        doc = {} if replace else (await asyncio.to_thread(_read_file, name) or {})
+        doc.update(fields)
+        await asyncio.to_thread(_write_file, name, doc)
+    elif SESSION_STORE == "mongo":
+        await db.save_session(name, fields, replace)
+
+
+async def start_with_session(client, name: str, token: str):
+    """client.start(), restoring the stored session first and saving the new one afterwards."""
+    doc = await _load(name) if enabled() else None
+    restored = bool(doc and doc.get("token") == _token_hash(token) and doc.get("session_string"))
+    if restored:
+        client.storage.session_string = doc["session_string"]
+    try:
+        await client.start()
+    except Unauthorized:
+        if not restored: raise
+        # Revoked/expired stored session: start over with a plain bot login
+        client.storage.session_string = None
+        restored = False
+        await client.start()
+    if enabled() and not restored:
+        await _update(name, {"token": _token_hash(token), "session_string": await client.export_session_string(), "media_keys": {}}, replace=True)
+
+
+async def media_auth_key(name: str, dc_id: int) -> Optional[bytes]:
+    if not enabled(): return None
+    key = ((await _load(name)) or {}).get("media_keys", {}).get(str(dc_id))
+    return base64.b64decode(key) if key else None
+
+
+async def save_media_auth_key(name: str, dc_id: int, auth_key: Optional[bytes]):
+    if not enabled(): return
+    doc = await _load(name) or {}
+    keys = dict(doc.get("media_keys", {}))
+    if auth_key: keys[str(dc_id)] = base64.b64encode(auth_key).decode()
+    else: keys.pop(str(dc_id), None)
+    await _update(name, {"media_keys": keys})
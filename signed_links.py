@@ -0,0 +1,86 @@
+# signed_links.py
+# Stateless HMAC-signed file links: the token itself carries the storage message id, an optional
+# expiry and the file metadata /show needs, so resolving a link needs no Mongo or Telegram call.
+
+import os
+import hmac
+import json
+import time
+import base64
+import hashlib
+from typing import Dict, Any, Optional
+
+from config import Config
+
+# LINK_SECRET should be set explicitly; the bot token is only a fallback so existing deploys keep working
+LINK_SECRET = os.environ.get("LINK_SECRET", "") or Config.BOT_TOKEN
+LINK_TTL = int(os.environ.get("LINK_TTL", 0))  # seconds, 0 = links never expire
+SIGNATURE_BYTES = 16
+# Bare message ids (and saved unique ids) from before signing; enumerable, so switch off once
+# the links posted before the migration no longer matter
+ALLOW_LEGACY_LINKS = os.environ.get("ALLOW_LEGACY_LINKS", "true").lower() in ("1", "true", "yes")
+
+_key = hashlib.sha256(b"signed-links:" + LINK_SECRET.encode()).digest() if LINK_SECRET else b""
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(payload: bytes) -> bytes:
+    return hmac.new(_key, payload, hashlib.sha256).digest()[:SIGNATURE_BYTES]
+
+
+def sign_link(message_id: int, file_name: str = "", file_size: int = 0, mime_type: str = "", ttl: int = LINK_TTL) -> str:
+    """
+    Token for a storage message. Without a secret the plain message id is returned, which the
+    resolvers only accept while ALLOW_LEGACY_LINKS is on.
+    """
+    if not _key:
+        return str(message_id)
+    data = {"m": int(message_id)}
+    if ttl: data["e"] = int(time.time()) + ttl
+    if file_name: data["n"] = file_name
+    if file_size: data["s"] = int(file_size)
+    if mime_type: data["t"] = mime_type
+    payload = json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode()
+    return f"{_b64encode(payload)}.{_b64encode(_sign(payload))}"
+
+
+def verify_link(token: str) -> Optional[Dict[str, Any]]:
+    """Decoded link metadata, or None for a malformed, forged or expired token."""
+    if not _key or not token or "." not in token:
+        return None
+    body, _, signature = token.partition(".")
+    try:
+        payload, given = _b64decode(body), _b64decode(signature)
+    except Exception:
+        return None
+    if not hmac.compare_digest(_sign(payload), given):
+        return None
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        return None
+    expires = int(data.get("e", 0))
+    if expires and expires < time.time():
+        return None
+    return {
+        "message_id": int(data["m"]),
+        "file_name": data.get("n", ""),
+        "file_size": int(data.get("s", 0)),
+        "mime_type": data.get("t", ""),
+        "expires": expires,
+    }
+
+
+def resolve_message_id(value: str) -> Optional[int]:
+    """/dl path segment -> storage message id; bare digits are legacy unsigned links."""
+    if value.isdigit():
+        return int(value) if ALLOW_LEGACY_LINKS else None
+    link = verify_link(value)
+    return link["message_id"] if link else None
@@ -0,0 +1,127 @@
+# tg_scheduler.py
+# Every outgoing (non-streaming) bot API call of the stream bot goes through here:
+# per-bot and per-chat token buckets, FloodWait turned into a delay + retry, and priorities
+# so replies to users are sent before channel edits and screenshot uploads.
+
+import os
+import time
+import heapq
+import asyncio
+import itertools
+from typing import Dict, Optional
+
+from pyrogram.errors import FloodWait
+
+from cache import TTLCache, MISSING
+from config import Config
+
+# Telegram's documented soft limits: ~30 messages/s per bot, ~1/s (20/min in groups) per chat.
+# The storage channel only receives the bot's own copies and uploads (the bot is an admin there),
+# so it gets its own, higher budget.
+BOT_RATE = float(os.environ.get("TG_BOT_RATE", 25))
+CHAT_RATE = float(os.environ.get("TG_CHAT_RATE", 1))
+CHAT_BURST = int(os.environ.get("TG_CHAT_BURST", 5))
+STORAGE_CHAT_RATE = float(os.environ.get("TG_STORAGE_CHAT_RATE", 5))
+STORAGE_CHAT_BURST = int(os.environ.get("TG_STORAGE_CHAT_BURST", 20))
+FLOOD_RETRIES = 3
+MAX_FLOOD_WAIT = int(os.environ.get("TG_MAX_FLOOD_WAIT", 300))  # longer waits fail instead of stalling the work
+
+PRIORITY_USER = 0        # replies in private chats / admin commands
+PRIORITY_CHANNEL = 1     # storage copies, channel caption edits
+PRIORITY_BACKGROUND = 2  # screenshot uploads, late short-link edits, progress messages
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    async def take(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class PriorityGate:
+    """A token bucket whose tokens are handed out strictly by (priority, arrival), not by wake-up order."""
+
+    def __init__(self, rate: float, burst: int):
+        self.bucket = TokenBucket(rate, burst)
+        self.blocked_until = 0.0  # FloodWait
+        self._waiters: list = []
+        self._seq = itertools.count()
+        self._pump: Optional[asyncio.Task] = None
+
+    async def turn(self, priority: int):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._dispatch())
+        await future
+
+    async def _dispatch(self):
+        while self._waiters:
+            while (delay := self.blocked_until - time.monotonic()) > 0:
+                await asyncio.sleep(delay)
+            await self.bucket.take()
+            while self._waiters:
+                _, _, future = heapq.heappop(self._waiters)
+                if not future.done():  # skip callers that were cancelled while queued
+                    future.set_result(None)
+                    break
+
+
+class TelegramScheduler:
+    """One per bot client: one bot-wide gate plus one gate per chat written to."""
+
+    def __init__(self, name: str, rate: float = BOT_RATE):
+        self.name = name
+        self.gate = PriorityGate(rate, max(1, int(rate)))
+        # idle chat gates expire (a fresh bucket starts full, which is what an idle one would be)
+        self.chat_gates = TTLCache(600, 10000)
+
+    def _chat_gate(self, chat) -> PriorityGate:
+        gate = self.chat_gates.get(chat)
+        if gate is MISSING:
+            if chat == Config.STORAGE_CHANNEL:
+                gate = PriorityGate(STORAGE_CHAT_RATE, STORAGE_CHAT_BURST)
+            else:
+                gate = PriorityGate(CHAT_RATE, CHAT_BURST)
+        self.chat_gates.set(chat, gate)
+        return gate
+
+    async def call(self, fn, *args, chat=None, priority: int = PRIORITY_USER, **kwargs):
+        """
+        Awaits fn(*args, **kwargs) once the chat and bot gates allow it. `chat` is the chat the
+        call writes to (None for bot-wide calls). FloodWait blocks that chat and retries.
+        """
+        for attempt in range(FLOOD_RETRIES + 1):
+            chat_gate = self._chat_gate(chat) if chat is not None else None
+            if chat_gate is not None:
+                await chat_gate.turn(priority)
+            await self.gate.turn(priority)
+            try:
+                return await fn(*args, **kwargs)
+            except FloodWait as e:
+                wait = int(e.value or 1)
+                if attempt == FLOOD_RETRIES or wait > MAX_FLOOD_WAIT:
+                    raise
+                (chat_gate or self.gate).blocked_until = time.monotonic() + wait
+                print(f"[tg] {self.name}: FloodWait {wait}s on chat {chat}, retry {attempt + 1}/{FLOOD_RETRIES}")
+
+
+schedulers: Dict[str, TelegramScheduler] = {}
+
+
+def scheduler_for(client) -> TelegramScheduler:
+    scheduler = schedulers.get(client.name)
+    if scheduler is None:
+        scheduler = schedulers[client.name] = TelegramScheduler(client.name)
+    return scheduler
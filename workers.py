@@ -0,0 +1,198 @@
+# workers.py
+# Multi-process mode (WEB_WORKERS > 1): a supervisor binds the HTTP socket once and forks
+# WEB_WORKERS uvicorn processes that all accept on it, plus one process for the Pella bot.
+#
+# Each web worker owns a slice of the MULTI_TOKEN clients (client_id % WEB_WORKERS) and its own
+# connection to the main bot; only worker 0 receives the main bot's updates. Workers publish
+# per-client stream counts into a shared-memory load table (-1 = client not running).
+#
+# The kernel decides which worker accepts a connection. /dl then reads the table: if another
+# worker has a client with at least HANDOFF_MARGIN fewer streams than this worker's least-busy
+# one, the request is handed off to that worker over its loopback port (HANDOFF_PORT_BASE + index)
+# and proxied back, so streams land on the least-loaded worker/client pair. Handed-off requests
+# carry HANDOFF_HEADER and are always served where they arrive.
+#
+# The Pella process connects its own stream database handle (pella_main.main), so channel
+# allow-list checks and screenshot sharing work there as they do in single-process mode.
+
+import os
+import sys
+import time
+import signal
+import socket
+import struct
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from typing import Dict, Optional
+
+WEB_WORKERS = max(1, int(os.environ.get("WEB_WORKERS", 1)))
+MAX_WORKERS = 32
+MAX_CLIENT_SLOTS = 64
+RESTART_MIN_UPTIME = 30  # seconds; processes dying faster than this are restarted with a delay
+HANDOFF_PORT_BASE = int(os.environ.get("WORKER_HANDOFF_PORT_BASE", 9100))
+HANDOFF_MARGIN = int(os.environ.get("WORKER_HANDOFF_MARGIN", 2))
+HANDOFF_HEADER = "x-worker-handoff"
+
+# Set in each forked worker before app is imported; defaults describe single-process mode
+WORKER_INDEX = 0
+WORKER_COUNT = 1
+PELLA_IN_PROCESS = True
+load_table: Optional["LoadTable"] = None
+
+
+class LoadTable:
+    """int32[MAX_WORKERS][MAX_CLIENT_SLOTS] in shared memory; each slot has exactly one writer."""
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool = False):
+        self.shm = shm
+        self.owner = owner
+        self.slots = shm.buf.cast("i")
+
+    @classmethod
+    def create(cls) -> "LoadTable":
+        shm = shared_memory.SharedMemory(create=True, size=MAX_WORKERS * MAX_CLIENT_SLOTS * struct.calcsize("i"))
+        table = cls(shm, owner=True)
+        for worker in range(MAX_WORKERS):
+            table.reset_worker(worker)
+        return table
+
+    def set(self, worker: int, client_id: int, value: int):
+        if worker < MAX_WORKERS and client_id < MAX_CLIENT_SLOTS:
+            self.slots[worker * MAX_CLIENT_SLOTS + client_id] = value
+
+    def reset_worker(self, worker: int):
+        for client_id in range(MAX_CLIENT_SLOTS):
+            self.set(worker, client_id, -1)
+
+    def snapshot(self, workers: int = MAX_WORKERS) -> Dict[int, Dict[int, int]]:
+        """worker -> {client_id: active streams} for running clients of the first `workers` rows."""
+        result: Dict[int, Dict[int, int]] = {}
+        for worker in range(workers):
+            row = {c: self.slots[worker * MAX_CLIENT_SLOTS + c] for c in range(MAX_CLIENT_SLOTS)}
+            row = {c: v for c, v in row.items() if v >= 0}
+            if row: result[worker] = row
+        return result
+
+    def close(self):
+        self.slots.release()
+        self.shm.close()
+        if self.owner: self.shm.unlink()
+
+
+def owns_client(client_id: int) -> bool:
+    """MULTI_TOKEN clients are partitioned across workers; the main bot (0) runs in every worker."""
+    return client_id == 0 or client_id % WORKER_COUNT == WORKER_INDEX
+
+
+def report_load(client_id: int, value: int):
+    if load_table is not None:
+        load_table.set(WORKER_INDEX, client_id, value)
+
+
+def handoff_target(own_load: int) -> Optional[str]:
+    """
+    Loopback base URL of the worker whose least-busy client has at least HANDOFF_MARGIN fewer
+    streams than `own_load` (this worker's least-busy client), or None to serve locally.
+    """
+    if load_table is None:
+        return None
+    best, best_load = None, own_load - HANDOFF_MARGIN + 1
+    for worker, row in load_table.snapshot(WORKER_COUNT).items():
+        if worker == WORKER_INDEX: continue
+        load = min(row.values())
+        if load < best_load:
+            best, best_load = worker, load
+    return f"http://127.0.0.1:{HANDOFF_PORT_BASE + best}" if best is not None else None
+
+
+def load_summary() -> str:
+    if load_table is None:
+        return "single process"
+    rows = load_table.snapshot()
+    return ", ".join(f"w{w}: " + "/".join(f"{c}={v}" for c, v in sorted(row.items())) for w, row in sorted(rows.items())) or "no clients up"
+
+
+def _listen(address, backlog: int = 2048) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(address)
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _serve(index: int, sock: socket.socket, handoff_sock: socket.socket, table: LoadTable):
+    # Set on the importable module: when started as `python workers.py` this code runs in __main__
+    import workers
+    workers.WORKER_INDEX, workers.WORKER_COUNT, workers.PELLA_IN_PROCESS, workers.load_table = index, WEB_WORKERS, False, table
+    import uvicorn
+    uvicorn.Server(uvicorn.Config("app:app")).run(sockets=[sock, handoff_sock])
+
+
+def _run_pella():
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)  # drop the supervisor's handlers inherited via fork
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    import asyncio
+    import pella_main
+    asyncio.run(pella_main.main(webhook=False))  # no HTTP server in this process
+
+
+def run(port: int = int(os.environ.get("PORT", 8000))):
+    if WEB_WORKERS > MAX_WORKERS:
+        sys.exit(f"WEB_WORKERS is capped at {MAX_WORKERS}")
+    ctx = mp.get_context("fork")
+    sock = _listen(("0.0.0.0", port))
+    # one loopback listener per worker, bound here so a restarted worker gets the same port back
+    handoff_socks = [_listen(("127.0.0.1", HANDOFF_PORT_BASE + i), 128) for i in range(WEB_WORKERS)]
+    table = LoadTable.create()
+
+    procs: Dict[str, mp.Process] = {}
+    started_at: Dict[str, float] = {}
+    targets = {f"web-{i}": (_serve, (i, sock, handoff_socks[i], table)) for i in range(WEB_WORKERS)}
+    targets["pella"] = (_run_pella, ())
+
+    def spawn(name: str):
+        target, args = targets[name]
+        procs[name] = ctx.Process(target=target, args=args, name=name)
+        procs[name].start()
+        started_at[name] = time.monotonic()
+        print(f"[workers] started {name} (pid {procs[name].pid})")
+
+    stopping = False
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for name in targets: spawn(name)
+
+    try:
+        while not stopping:
+            time.sleep(1)
+            for name, proc in list(procs.items()):
+                if proc.is_alive() or stopping: continue
+                uptime = time.monotonic() - started_at[name]
+                print(f"[workers] {name} exited with {proc.exitcode} after {uptime:.0f}s")
+                if name.startswith("web-"): table.reset_worker(int(name[4:]))
+                if name == "pella" and uptime < RESTART_MIN_UPTIME:
+                    # usually missing Pella env; the web workers keep running without it
+                    print("[workers] pella died during startup, not restarting")
+                    del procs[name]
+                    continue
+                if uptime < RESTART_MIN_UPTIME: time.sleep(5)
+                spawn(name)
+    finally:
+        for proc in procs.values():
+            if proc.is_alive(): proc.terminate()
+        for proc in procs.values():
+            proc.join(10)
+            if proc.is_alive(): proc.kill()
+        sock.close()
+        for handoff_sock in handoff_socks: handoff_sock.close()
+        table.close()
+
+
+if __name__ == "__main__":
+    run()